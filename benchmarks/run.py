@@ -0,0 +1,566 @@
+"""
+Offline benchmark suite: ingest, search and bot round-trip.
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --sizes 1000 10000 --concurrency 1 8 --baseline bench.json --output new.json
+
+Everything runs locally in a temporary directory (Chroma store, BM25 index, caches):
+- Habr pages are served by a local fixture server: recorded pages from
+  PARSING_FIXTURES_DIR (`python -m core.parsing_bench --record`) or synthetic ones.
+- The OpenAI API is a local stub (optionally with latency), streaming included.
+- The Telegram Bot API is bot/simulate_updates.FakeBotAPI; updates are posted to an
+  in-process webhook handler.
+The embedding model must be in the local Hugging Face cache (HF_HUB_OFFLINE is set).
+
+Phases:
+- ingest: fetch + parse + chunk + embed + store `--articles` pages; articles/s, chunks/s,
+  per-stage times (core/metrics.py), and a re-run over the unchanged feed.
+- search: the store is emptied (ingested pages would distort the smallest sizes), the
+  corpus is grown to each of `--sizes` chunks with filler articles, then
+  `--queries` distinct queries run at each `--concurrency` level with cold caches.
+  Filler vectors are random by default (`--fill-embeddings model` encodes them,
+  much slower); latency depends on corpus size, not on the vectors' meaning.
+  A size the corpus already exceeds is skipped and marked "skipped" in the output.
+- e2e: simulated users send messages to the webhook; latency until the bot's reply.
+Peak RSS is recorded after each phase. With --baseline, numeric results are compared
+and changes beyond --threshold in the wrong direction are reported as regressions.
+"""
+import argparse
+import asyncio
+import email.utils
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+logger = logging.getLogger("benchmarks")
+
+BOT_TOKEN = "123456:BENCHMARK"
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def latency_report(latencies: List[float], elapsed: float) -> Dict:
+    from bot.simulate_updates import percentile
+    return {
+        'requests': len(latencies),
+        'per_sec': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_sec': percentile(latencies, 50),
+        'p95_sec': percentile(latencies, 95),
+        'p99_sec': percentile(latencies, 99),
+    }
+
+def configure_environment(workdir: str, llm_url: str, api_url: str):
+    """
+    Points every setting at local stand-ins. Must run before config is imported:
+    CHROMA_PATH and the SQLite stores are resolved from the working directory.
+    Explicit environment values still win (e.g. SEARCH_MODE, EMBEDDING_BACKEND).
+    """
+    os.chdir(workdir)
+    defaults = {
+        'BOT_TOKEN': BOT_TOKEN,
+        'CHROMA_HOST': "",
+        'TELEGRAM_API_URL': api_url,
+        'OPENAI_API_KEY': "benchmark",
+        'OPENAI_BASE_URL': llm_url,
+        'WARMUP_ON_STARTUP': "0",
+        'METRICS_ENABLED': "1",
+        # Measure this code, not politeness delays or Telegram's flood limits
+        'SCRAPER_RATE_PER_HOST': "1000",
+        'SCRAPER_BURST': "1000",
+        'SEND_CHAT_RATE': "1000",
+        'SEND_CHAT_BURST': "1000",
+        'SEND_GLOBAL_RATE': "100000",
+        'HF_HUB_OFFLINE': "1",
+        'TRANSFORMERS_OFFLINE': "1",
+        'ANONYMIZED_TELEMETRY': "False",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+# --- Fixtures ---
+
+def load_pages(fixtures_dir: str, synthetic_pages: int) -> Tuple[List[bytes], List[Dict], str]:
+    """Article pages and RSS item metadata: recorded if available, else synthetic."""
+    from core import parsing
+    from core.parsing_bench import load_fixtures, synthetic_rss
+
+    rss_docs, pages, source = load_fixtures(fixtures_dir, synthetic_pages)
+    items = parsing.parse_rss_bs4(rss_docs[0])
+    if not items:
+        items = parsing.parse_rss_bs4(synthetic_rss(random.Random(0)))
+    return pages, items, source
+
+def build_rss(base_url: str, items: List[Dict], count: int) -> bytes:
+    """A feed of `count` distinct articles whose links point at the fixture server."""
+    now = time.time()
+    entries = []
+    for i in range(count):
+        item = items[i % len(items)]
+        entries.append(
+            f"<item><title>{escape(item['title'])} #{i}</title>"
+            f"<link>{base_url}/articles/{i}/</link>"
+            f"<pubDate>{email.utils.formatdate(now - i * 3600, usegmt=True)}</pubDate>"
+            f"<description>{escape(item['description'])}</description>"
+            f"<dc:creator>{escape(item['creator'])}</dc:creator></item>"
+        )
+    return (
+        "<?xml version='1.0' encoding='UTF-8'?>"
+        "<rss version='2.0' xmlns:dc='http://purl.org/dc/elements/1.1/'><channel>"
+        f"<title>Habr (benchmark)</title>{''.join(entries)}</channel></rss>"
+    ).encode("utf-8")
+
+class FixtureServer:
+    """Serves /rss and /articles/<n>/ from memory."""
+
+    def __init__(self, pages: List[bytes], items: List[Dict], articles: int, port: int):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        self.pages = pages
+        self.rss = build_rss(self.url, items, articles)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _rss(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.rss, content_type="application/rss+xml")
+
+    async def _article(self, request: web.Request) -> web.Response:
+        page = self.pages[int(request.match_info['n']) % len(self.pages)]
+        return web.Response(body=page, content_type="text/html", charset="utf-8")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/rss", self._rss)
+        app.router.add_get("/articles/{n}/", self._article)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+class StubOpenAI:
+    """
+    OpenAI-compatible /v1/chat/completions: a canned answer after `latency`
+    seconds, streamed word by word when requested, with token usage.
+    """
+
+    ANSWER = ("Статьи описывают практические приёмы: профилирование, кэширование "
+              "и асинхронный ввод-вывод. Авторы сравнивают подходы на реальных сервисах.")
+
+    def __init__(self, port: int, latency: float = 0.0):
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}/v1"
+        self.latency = latency
+        self.calls = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    def _usage(self, body: Dict) -> Dict:
+        prompt = sum(len(m.get('content', '')) for m in body.get('messages', [])) // 4
+        completion = len(self.ANSWER) // 4
+        return {'prompt_tokens': prompt, 'completion_tokens': completion, 'total_tokens': prompt + completion}
+
+    async def _completions(self, request: web.Request) -> web.StreamResponse:
+        self.calls += 1
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+        base = {'id': f"bench-{self.calls}", 'created': int(time.time()), 'model': body.get('model', 'stub')}
+        if not body.get('stream'):
+            return web.json_response({
+                **base, 'object': "chat.completion",
+                'choices': [{'index': 0, 'finish_reason': "stop",
+                             'message': {'role': "assistant", 'content': self.ANSWER}}],
+                'usage': self._usage(body),
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': "text/event-stream"})
+        await response.prepare(request)
+
+        async def event(payload):
+            await response.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        for word in self.ANSWER.split(" "):
+            await event({**base, 'object': "chat.completion.chunk",
+                         'choices': [{'index': 0, 'delta': {'content': word + " "}, 'finish_reason': None}]})
+        await event({**base, 'object': "chat.completion.chunk",
+                     'choices': [{'index': 0, 'delta': {}, 'finish_reason': "stop"}]})
+        await event({**base, 'object': "chat.completion.chunk", 'choices': [], 'usage': self._usage(body)})
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self._completions)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+# --- Phases ---
+
+async def bench_ingest(rag, fixture_url: str, articles: int) -> Dict:
+    from core.metrics import metrics
+    from core.scraper import HabrScraper
+
+    scraper = HabrScraper(rss_url=fixture_url + "/rss")
+    metrics.reset()
+    try:
+        started = time.perf_counter()
+        fetched = await scraper.get_latest_articles_async(limit=articles, skip=rag.is_unchanged)
+        fetch_sec = time.perf_counter() - started
+        indexed_at = time.perf_counter()
+        stats = await rag.add_documents(fetched)
+        index_sec = time.perf_counter() - indexed_at
+        total_sec = time.perf_counter() - started
+        chunks = rag.rag.collection.count()
+        stages = metrics.summary()
+
+        # Same feed again: every article is skipped before its page is fetched
+        started = time.perf_counter()
+        again = await scraper.get_latest_articles_async(limit=articles, skip=rag.is_unchanged)
+        restats = await rag.add_documents(again)
+        rerun_sec = time.perf_counter() - started
+    finally:
+        await scraper.close()
+
+    return {
+        'articles': stats['added'] + stats['updated'],
+        'chunks': chunks,
+        'fetch_parse_sec': round(fetch_sec, 3),
+        'index_sec': round(index_sec, 3),
+        'total_sec': round(total_sec, 3),
+        'articles_per_sec': round(len(fetched) / total_sec, 2) if total_sec else None,
+        'chunks_per_sec': round(chunks / index_sec, 2) if index_sec else None,
+        'unchanged_rerun_sec': round(rerun_sec, 3),
+        'unchanged_rerun_skipped': restats['skipped'],
+        'stages': stages,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def filler_article(i: int, rng: random.Random, words: List[str], paragraphs: int = 12) -> Dict:
+    text = "\n\n".join(
+        " ".join(rng.choice(words) for _ in range(rng.randint(60, 120))).capitalize() + "."
+        for _ in range(paragraphs)
+    )
+    return {
+        'title': f"Filler article {i}",
+        'link': f"https://bench.local/filler/{i}/",
+        'pub_date': email.utils.formatdate(time.time() - i * 600, usegmt=True),
+        'creator': f"filler{i % 50}",
+        'description': text[:200],
+        'full_text': text,
+    }
+
+def random_embedder(dim: int, seed: int = 0):
+    import numpy as np
+    rng = np.random.default_rng(seed)
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        vectors = rng.standard_normal((len(texts), dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors.tolist()
+    return embed
+
+def empty_store(engine):
+    """Deletes every chunk and article record, so the search sweep starts from an empty corpus."""
+    for collection in (engine.collection, engine.article_collection):
+        while True:
+            ids = collection.get(include=[], limit=engine.max_batch_size)['ids']
+            if not ids:
+                break
+            collection.delete(ids=ids)
+    engine.rebuild_lexical_index()
+
+def grow_corpus(engine, size: int, words: List[str], fill_embeddings: str, state: Dict) -> float:
+    """
+    Adds filler articles until the collection holds at least `size` chunks. Returns
+    seconds spent. After a first batch of 10 articles, batches are sized from the
+    chunks per article seen so far, so the corpus ends close to `size`.
+    """
+    started = time.perf_counter()
+    embed_documents = engine.embed_documents
+    if fill_embeddings == "random":
+        engine.embed_documents = random_embedder(len(engine.embed_queries(["dimension probe"])[0]))
+    try:
+        while True:
+            count = engine.collection.count()
+            if count >= size:
+                break
+            per_article = count / state['next'] if state['next'] else None
+            articles = 10 if not per_article else max(1, min(200, int((size - count) / per_article)))
+            batch = [filler_article(state['next'] + i, state['rng'], words) for i in range(articles)]
+            state['next'] += len(batch)
+            engine.add_documents(batch, save_index=False)
+    finally:
+        engine.embed_documents = embed_documents
+        engine.save_lexical_index()
+    return time.perf_counter() - started
+
+def make_queries(count: int, words: List[str], seed: int) -> List[str]:
+    from bot.simulate_updates import DEFAULT_QUERIES
+    rng = random.Random(seed)
+    queries = list(DEFAULT_QUERIES)
+    seen = set(queries)
+    while len(queries) < count:
+        query = " ".join(rng.sample(words, rng.randint(1, 5)))
+        if query not in seen:
+            seen.add(query)
+            queries.append(query)
+    return queries[:count]
+
+async def bench_search_level(rag, queries: List[str], concurrency: int) -> Dict:
+    # Cold caches: every query is encoded and searched
+    rag.rag.result_cache.clear()
+    rag.rag.embedding_cache.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query: str):
+        async with semaphore:
+            started = time.perf_counter()
+            await rag.search(query, n_results=3)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    return latency_report(latencies, time.perf_counter() - started)
+
+async def bench_search(rag, sizes: List[int], levels: List[int], query_count: int,
+                       fill_embeddings: str, words: List[str]) -> Dict:
+    from core.metrics import metrics
+
+    engine = rag.rag
+    # Ingested pages would count towards the first sizes; measure on filler only
+    await asyncio.to_thread(empty_store, engine)
+    state = {'next': 0, 'rng': random.Random(1)}
+    report = {}
+    for size in sorted(sizes):
+        chunks = engine.collection.count()
+        if chunks > size:
+            # A smaller size overshot this one: a run here would be labelled wrongly
+            logger.warning(f"search size={size} skipped: the corpus already has {chunks} chunks")
+            report[str(size)] = {'skipped': True, 'chunks': chunks}
+            continue
+        fill_sec = await asyncio.to_thread(grow_corpus, engine, size, words, fill_embeddings, state)
+        by_level = {}
+        for level in levels:
+            metrics.reset()
+            result = await bench_search_level(rag, make_queries(query_count, words, seed=size + level), level)
+            result['stages'] = {k: v for k, v in metrics.summary().items() if k.startswith("search_stage")}
+            by_level[f"c{level}"] = result
+            logger.info(f"search size={size} concurrency={level}: p50={result['p50_sec']}s "
+                        f"p95={result['p95_sec']}s ({result['per_sec']}/s)")
+        report[str(size)] = {
+            'chunks': engine.collection.count(),
+            'fill_sec': round(fill_sec, 1),
+            'concurrency': by_level,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    return report
+
+async def bench_e2e(rag, api_port: int, chats: int, messages: int) -> Dict:
+    from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+    from bot.main import create_bot, create_dispatcher
+    from bot.services import services
+    from bot.simulate_updates import FakeBotAPI, run_load
+
+    api = FakeBotAPI("127.0.0.1", api_port)
+    await api.start()
+    # The engine built for the other phases serves the handlers
+    services.rag = rag
+    services.state = "ready"
+    bot = create_bot()
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=create_dispatcher(), bot=bot).register(app, path="/webhook")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        rag.rag.result_cache.clear()
+        report = await run_load(f"http://127.0.0.1:{port}/webhook", api, chats, messages)
+        # Let summaries that are still streaming finish before tearing down
+        await asyncio.sleep(1.0)
+    finally:
+        await runner.cleanup()
+        await services.sender.close()
+        services.filters.close()
+        await bot.session.close()
+        await api.stop()
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+# --- Baseline comparison ---
+
+SKIPPED = ("meta", "stages", "api_calls", "errors")
+
+def _flatten(data, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        if key in SKIPPED:
+            continue
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> Dict:
+    """Relative change per shared metric; regressions are changes beyond `threshold` for the worse."""
+    base = _flatten(baseline)
+    changes, regressions = {}, []
+    for path, value in _flatten(current).items():
+        old = base.get(path)
+        if not old:
+            continue
+        change = (value - old) / old
+        changes[path] = {'baseline': old, 'current': value, 'change': round(change, 4)}
+        # Throughputs end in per_sec; times (e.g. reply_latency_sec.p95) and memory should shrink
+        if path.endswith("per_sec"):
+            worse = change < -threshold
+        elif "_sec" in path or path.endswith("rss_mb"):
+            worse = change > threshold
+        else:
+            worse = False
+        if worse:
+            regressions.append(path)
+    return {'threshold': threshold, 'changes': changes, 'regressions': regressions}
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+# --- Main ---
+
+async def run(args) -> Dict:
+    fixture_port, llm_port, api_port = free_port(), free_port(), free_port()
+    workdir = tempfile.mkdtemp(prefix="habr-bench-")
+    configure_environment(workdir, f"http://127.0.0.1:{llm_port}/v1", f"http://127.0.0.1:{api_port}")
+
+    from config import config
+    from core.async_services import AsyncRagEngine
+    from core.parsing_bench import WORDS
+    from core.rag_engine import RagEngine
+
+    pages, items, source = load_pages(args.fixtures, args.pages)
+    fixtures = FixtureServer(pages, items, args.articles, fixture_port)
+    llm = StubOpenAI(llm_port, args.llm_latency)
+    await fixtures.start()
+    await llm.start()
+
+    report = {'meta': {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'fixtures': source,
+        'embedding_model': config.EMBEDDING_MODEL,
+        'embedding_backend': config.EMBEDDING_BACKEND,
+        'search_mode': config.SEARCH_MODE,
+        'args': vars(args),
+        'workdir': workdir,
+    }}
+    rag = None
+    try:
+        started = time.perf_counter()
+        engine = await asyncio.to_thread(RagEngine)
+        engine.embed_queries(["warm-up"], lookup=False)
+        report['startup'] = {'engine_sec': round(time.perf_counter() - started, 3), 'peak_rss_mb': peak_rss_mb()}
+        rag = AsyncRagEngine(engine)
+
+        if "ingest" in args.phases:
+            logger.info(f"Ingesting {args.articles} articles from the fixture server...")
+            report['ingest'] = await bench_ingest(rag, fixtures.url, args.articles)
+        if "search" in args.phases:
+            words = sorted(set(WORDS) | {w for item in items for w in item['title'].lower().split() if w.isalpha()})
+            report['search'] = await bench_search(rag, args.sizes, args.concurrency, args.queries,
+                                                  args.fill_embeddings, words)
+        if "e2e" in args.phases:
+            logger.info(f"Simulating {args.chats} chats x {args.messages} messages...")
+            report['e2e'] = await bench_e2e(rag, api_port, args.chats, args.messages)
+            report['e2e']['llm_calls'] = llm.calls
+    finally:
+        if rag:
+            await rag.close()
+        await llm.stop()
+        await fixtures.stop()
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline ingest / search / bot benchmarks")
+    parser.add_argument("--phases", nargs="+", default=["ingest", "search", "e2e"],
+                        choices=["ingest", "search", "e2e"])
+    parser.add_argument("--fixtures", default=None, help="recorded pages (default: PARSING_FIXTURES_DIR)")
+    parser.add_argument("--pages", type=int, default=20, help="synthetic pages when nothing is recorded")
+    parser.add_argument("--articles", type=int, default=50, help="articles in the fixture feed")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="corpus sizes in chunks")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--queries", type=int, default=200, help="distinct queries per search run")
+    parser.add_argument("--fill-embeddings", choices=["random", "model"], default="random")
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub OpenAI response delay, seconds")
+    parser.add_argument("--output", default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    # Resolved before the run moves into its temporary directory
+    args.output = os.path.abspath(args.output) if args.output else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+    # Not via config: it must first be imported inside the temporary directory
+    args.fixtures = os.path.abspath(args.fixtures or os.getenv("PARSING_FIXTURES_DIR", os.path.join("fixtures", "habr")))
+
+    report = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report['comparison'] = compare(report, json.load(f), args.threshold)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        logger.info(f"Report written to {args.output}")
+    print(text)
+
+    regressions = report.get('comparison', {}).get('regressions', [])
+    if regressions:
+        logger.warning(f"Regressions beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict
+
+from core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Date filter presets: period -> days back from now
+PERIODS = {'week': 7, 'month': 30, 'year': 365}
+
+def search_filters(filters: Dict) -> Dict:
+    """
+    Converts stored chat filters into RagEngine.search filters.
+    The period start is rounded down to the hour, so the search result cache
+    keeps hitting for an hour instead of missing on every request.
+    """
+    result = {}
+    days = PERIODS.get(filters.get('period'))
+    if days:
+        hour_start = int(time.time()) // 3600 * 3600
+        result['since'] = hour_start - days * 86400
+    if filters.get('author'):
+        result['author'] = filters['author']
+    return result
+
+class FilterStore:
+    """
+    Per-chat search filters persisted in SQLite, so they survive restarts and are
+    shared by all worker processes on the host. Recently active chats are kept in
+    a bounded LRU in front of the database; it is dropped whenever another
+    process commits a change (SQLite's data_version).
+    """
+
+    def __init__(self, path: str, cache_size: int = 1024):
+        self.path = path
+        self._cache = TTLCache(cache_size, ttl=3600)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_filters ("
+            "chat_id INTEGER PRIMARY KEY, filters TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync(self):
+        # data_version only changes on commits made by other connections
+        with self._lock:
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._cache.clear()
+
+    def get(self, chat_id: int) -> Dict:
+        self._sync()
+        cached = self._cache.get(chat_id)
+        if cached is None:
+            with self._lock:
+                row = self._conn.execute("SELECT filters FROM chat_filters WHERE chat_id = ?", (chat_id,)).fetchone()
+            cached = json.loads(row[0]) if row else {}
+            # Chats without filters are cached too, as an empty dict
+            self._cache.set(chat_id, cached)
+        return dict(cached)
+
+    def set(self, chat_id: int, filters: Dict):
+        filters = {k: v for k, v in filters.items() if v}
+        with self._lock:
+            if filters:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO chat_filters (chat_id, filters, updated) VALUES (?, ?, ?)",
+                    (chat_id, json.dumps(filters, ensure_ascii=False), time.time())
+                )
+            else:
+                self._conn.execute("DELETE FROM chat_filters WHERE chat_id = ?", (chat_id,))
+            self._conn.commit()
+        self._cache.set(chat_id, filters)
+
+    def update(self, chat_id: int, **changes) -> Dict:
+        """Sets the given filters; a None or empty value removes that filter."""
+        filters = self.get(chat_id)
+        filters.update(changes)
+        self.set(chat_id, filters)
+        return self.get(chat_id)
+
+    def clear(self, chat_id: int):
+        self.set(chat_id, {})
+
+    def stats(self) -> Dict:
+        return {'cache': self._cache.stats()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,24 +1,52 @@
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
-from bot.keyboards import get_main_keyboard, get_article_keyboard, get_filter_keyboard
-from core.rag_engine import RagEngine
-from core.scraper import HabrScraper
-from core.llm_service import llm_service
+from aiogram.filters import Command, CommandObject
+from bot.keyboards import get_main_keyboard, get_article_keyboard, get_filter_keyboard, get_results_keyboard
+from bot.services import services
+from bot.filter_store import search_filters
+from core.ids import make_article_id
+from core.llm_service import llm_service, EMPTY_QUIZ_TEXT
+from core.metrics import metrics
+from config import config
+import asyncio
+import html
+import json
 import logging
+from functools import partial
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-rag = RagEngine()
-scraper = HabrScraper()
+# Summary currently being streamed per chat; a new query cancels the previous one
+summary_tasks = {}
 
-# Simple in-memory storage for user filters (chat_id -> filter_dict)
-user_filters = {}
+SUMMARY_HEADER = "📝 Краткое резюме по вашему запросу:\n\n"
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+PERIOD_LABELS = {'week': "за неделю", 'month': "за месяц", 'year': "за год"}
+
+WARMING_UP_TEXT = "⏳ Бот ещё прогревается (загружаются модель и база знаний). Попробуйте через несколько секунд."
+
+async def ensure_ready(event) -> bool:
+    """
+    Replies with a "warming up" notice while services are not ready yet.
+    Also starts the warm-up if it was not started at launch.
+    """
+    if services.ready:
+        return True
+    services.start_warm_up()
+    if isinstance(event, CallbackQuery):
+        # A callback answer (popup) is not a chat message and is not rate limited
+        await event.answer(WARMING_UP_TEXT, show_alert=True)
+    else:
+        await services.sender.answer(event, WARMING_UP_TEXT)
+    return False
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
-    await message.answer(
+    await services.sender.answer(
+        message,
         "Привет! Я AI-агент для поиска по статьям Хабра.\n"
         "Просто напиши мне свой вопрос или тему, и я найду релевантные материалы.\n"
         "Используй '🔄 Обновить базу знаний' для загрузки свежих статей.",
@@ -27,116 +55,276 @@ async def cmd_start(message: Message):
 
 @router.message(F.text == "🔄 Обновить базу знаний")
 async def sync_knowledge_base(message: Message):
-    status_msg = await message.answer("Начинаю загрузку свежих статей с Хабра...")
-    try:
-        articles = scraper.get_latest_articles(limit=5)
-        if articles:
-            rag.add_documents(articles)
-            await status_msg.edit_text(f"✅ Успешно загружено {len(articles)} статей в базу знаний!")
-        else:
-            await status_msg.edit_text("⚠️ Не удалось получить статьи или нет новых.")
-    except Exception as e:
-        logger.error(f"Sync error: {e}")
-        await status_msg.edit_text("❌ Произошла ошибка при обновлении базы.")
+    if not await ensure_ready(message):
+        return
+    status_msg = await services.sender.answer(message, "Начинаю загрузку свежих статей с Хабра...")
+
+    async def report(text: str):
+        # Progress edits are the most frequent messages: queued like all others
+        await services.sender.edit(status_msg, text)
+
+    # Runs in the background ingestion worker; concurrent presses share one job
+    job, joined = services.ingestion.trigger(report)
+    # A job that is already finishing replays its result to `report` instead
+    if joined and job.result_text is None:
+        await services.sender.edit(status_msg, "⏳ Обновление базы уже идёт, сообщу о результате здесь.")
+
+def describe_filters(filters: dict) -> str:
+    filter_text = "Активные фильтры:\n"
+    if not filters:
+        return filter_text + "Нет активных фильтров."
+    if filters.get('period'):
+        filter_text += f"- Дата: {PERIOD_LABELS.get(filters['period'], filters['period'])}\n"
+    if filters.get('author'):
+        filter_text += f"- Автор: {filters['author']}\n"
+    return filter_text
 
 @router.message(F.text == "⚙️ Фильтры")
 async def show_filters(message: Message):
-    current_filters = user_filters.get(message.chat.id, {})
-    filter_text = "Активные фильтры:\n"
-    if not current_filters:
-        filter_text += "Нет активных фильтров."
-    else:
-        for k, v in current_filters.items():
-            filter_text += f"- {k}: {v}\n"
-            
-    await message.answer(filter_text, reply_markup=get_filter_keyboard())
+    current_filters = services.filters.get(message.chat.id)
+    await services.sender.answer(message, describe_filters(current_filters), reply_markup=get_filter_keyboard())
+
+@router.message(Command("author"))
+async def cmd_author(message: Message, command: CommandObject):
+    # /author <name> sets the author filter, /author alone removes it
+    name = (command.args or "").strip()
+    filters = services.filters.update(message.chat.id, author=name or None)
+    await services.sender.answer(message, describe_filters(filters))
 
 @router.callback_query(F.data.startswith("filter:"))
 async def handle_filter_callback(callback: CallbackQuery):
-    action = callback.data.split(":")[1]
-    
+    # Format: filter:reset | filter:author | filter:date:<week|month|year|all>
+    parts = callback.data.split(":")
+    action = parts[1]
+    chat_id = callback.message.chat.id
+
+    if action == "author":
+        await callback.answer("Отправьте /author <имя автора>, чтобы искать только его статьи. "
+                              "/author без имени снимает фильтр.", show_alert=True)
+        return
+
     if action == "reset":
-        user_filters.pop(callback.message.chat.id, None)
-        await callback.message.edit_text("Фильтры сброшены.", reply_markup=get_filter_keyboard())
+        services.filters.clear(chat_id)
+        filters = {}
     elif action == "date":
-        # Placeholder for date filtering logic customization
-        # making it simple for now
-        await callback.answer("Фильтр по дате пока не настроен детально (mock).")
-    
-    await callback.answer()
+        period = parts[2] if len(parts) > 2 else "all"
+        filters = services.filters.update(chat_id, period=period if period != "all" else None)
+    else:
+        await callback.answer()
+        return
+
+    try:
+        await services.sender.edit(callback.message, describe_filters(filters), reply_markup=get_filter_keyboard())
+    except TelegramBadRequest as e:
+        # Same filters chosen again: "message is not modified"
+        logger.debug(f"Filter menu edit skipped: {e}")
+    await callback.answer("Фильтры обновлены.")
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    # Queue depth, throttle delays and cache counters, for operators only
+    if not message.from_user or message.from_user.id not in config.ADMIN_IDS:
+        await services.sender.answer(message, "Команда доступна только администраторам.")
+        return
+    stats = json.dumps(services.stats(), ensure_ascii=False, indent=1)
+    await services.sender.answer(message, f"<pre>{html.escape(stats)}</pre>"[:TELEGRAM_MESSAGE_LIMIT], parse_mode="HTML")
 
 @router.message(F.text == "ℹ️ О боте")
 async def about_bot(message: Message):
-    await message.answer(
+    await services.sender.answer(
+        message,
         "Этот бот использует RAG (Retrieval-Augmented Generation) для поиска ответов.\n"
         "Стек: Python, aiogram, ChromaDB, SentenceTransformers."
     )
 
 @router.callback_query(F.data.startswith("similar:"))
 async def handle_similar_articles(callback: CallbackQuery):
-    # Format: similar:ShortTitle
-    # We need to find the full title or just use the short one for search
-    short_title = callback.data.split(":", 1)[1]
-    await callback.message.answer(f"🔍 Ищу статьи, похожие на: {short_title}...")
-    
-    results = rag.get_recommendations(short_title, n_results=3)
+    if not await ensure_ready(callback):
+        return
+    # Format: similar:<article_id>
+    article_id = callback.data.split(":", 1)[1]
+    article = await services.rag.get_article(article_id, include_content=False)
+
+    if article:
+        title = article['metadata']['title']
+        await services.sender.answer(callback.message, f"🔍 Ищу статьи, похожие на: {title}...")
+        results = await services.rag.get_similar_articles(article_id, n_results=3)
+        if results is None:
+            results = await services.rag.get_recommendations(title, n_results=3)
+    else:
+        # Buttons sent before article IDs were introduced carry a short title
+        await services.sender.answer(callback.message, f"🔍 Ищу статьи, похожие на: {article_id}...")
+        results = await services.rag.get_recommendations(article_id, n_results=3)
+
     await send_search_results(callback.message, results)
     await callback.answer()
 
 @router.callback_query(F.data.startswith("quiz:"))
 async def handle_quiz(callback: CallbackQuery):
-    short_title = callback.data.split(":", 1)[1]
-    
-    # Try to fetch article content from DB for better quiz
-    results = rag.search(short_title, n_results=1)
-    content = results[0]['content'] if results else ""
-    
-    quiz_text = llm_service.generate_quiz(short_title, content)
-    await callback.message.answer(quiz_text)
+    if not await ensure_ready(callback):
+        return
+    # Format: quiz:<article_id>
+    article_id = callback.data.split(":", 1)[1]
+
+    # Token-budgeted selection of the article's most representative chunks
+    context = await services.rag.build_article_context(article_id)
+    # A record whose chunks are missing gives an empty context: use the other paths then
+    if not (context and context.get('text')):
+        context = None
+    article = None if context else await services.rag.get_article(article_id)
+    if context:
+        title = context['title']
+        content = context['text']
+        logger.info(f"Quiz context: {context['tokens']} tokens from {context['chunks']} chunks")
+    elif article:
+        title = article['metadata']['title']
+        content = article['content']
+    else:
+        # Legacy button with a short title: fall back to semantic search
+        title = article_id
+        results = await services.rag.search(article_id, n_results=1)
+        content = results[0]['content'] if results else ""
+
+    if not content.strip():
+        await services.sender.answer(callback.message, EMPTY_QUIZ_TEXT)
+        await callback.answer()
+        return
+    quiz_text = await llm_service.generate_quiz_async(title, content)
+    await services.sender.answer(callback.message, quiz_text)
     await callback.answer()
 
+def _snippet(res: dict, limit: int = 500) -> str:
+    meta = res['metadata']
+    # Prefer RSS description (clean summary) over random chunk
+    description = meta.get('description', '')
+    if len(description) > 50:
+        return description[:limit] + ("..." if len(description) > limit else "")
+    # Fallback to chunk content if description is missing/too short
+    return res['content'][:min(limit, 400)].replace('\n', ' ') + "..."
+
+def render_results_compact(results: list) -> str:
+    """All results in one HTML message; buttons come from get_results_keyboard."""
+    lines = [f"🔎 Найдено статей: {len(results)}"]
+    for idx, res in enumerate(results, 1):
+        meta = res['metadata']
+        lines.append(
+            f"\n<b>{idx}. {html.escape(meta['title'])}</b>\n"
+            f"{html.escape(_snippet(res, 300))}\n"
+            f"📅 {html.escape(meta.get('pub_date', ''))} · ✍️ {html.escape(meta.get('creator') or 'Habr User')}"
+        )
+    return "\n".join(lines)[:TELEGRAM_MESSAGE_LIMIT]
+
 async def send_search_results(message: Message, results: list):
+    sender = services.sender
     if not results:
-        await message.answer("Ничего не найдено.")
+        await sender.answer(message, "Ничего не найдено.")
+        return
+
+    if config.RESULTS_RENDER_MODE == "compact":
+        # One API call for all results instead of one per result
+        articles = [(r['metadata']['link'], r['metadata'].get('article_id') or make_article_id(r['metadata']['link']))
+                    for r in results]
+        await sender.answer(message, render_results_compact(results),
+                            reply_markup=get_results_keyboard(articles), parse_mode="HTML")
         return
 
     for idx, res in enumerate(results, 1):
         meta = res['metadata']
-        # Expanded snippet as summary
-        # Prefer RSS description (clean summary) over random chunk
-        description = meta.get('description', '')
-        if len(description) > 50:
-            snippet = description[:500] + ("..." if len(description) > 500 else "")
-        else:
-            # Fallback to chunk content if description is missing/too short
-            snippet = res['content'][:400].replace('\n', ' ') + "..."
-        
-        await message.answer(
+        await sender.answer(
+            message,
             f"**{idx}. {meta['title']}**\n\n"
-            f"📝 **Аннотация:**\n{snippet}\n\n"
+            f"📝 **Аннотация:**\n{_snippet(res)}\n\n"
             f"📅 {meta['pub_date']}\n"
             f"✍️ {meta.get('creator', 'Habr User')}",
-            reply_markup=get_article_keyboard(meta['link'], meta['title']),
+            reply_markup=get_article_keyboard(meta['link'], meta.get('article_id') or make_article_id(meta['link'])),
             parse_mode="Markdown"
         )
 
+async def _edit_summary(summary_msg: Message, text: str):
+    try:
+        await services.sender.edit(summary_msg, (SUMMARY_HEADER + text)[:TELEGRAM_MESSAGE_LIMIT])
+    except TelegramBadRequest as e:
+        # "message is not modified" and similar are harmless here
+        logger.debug(f"Summary edit skipped: {e}")
+
+async def stream_summary_to_chat(message: Message, context: str, query: str):
+    """
+    Sends a placeholder message and progressively edits it as summary tokens
+    arrive. Edits are throttled to SUMMARY_EDIT_INTERVAL to stay within
+    Telegram's rate limits; the whole stream is bounded by SUMMARY_STREAM_TIMEOUT.
+    """
+    summary_msg = await services.sender.answer(message, SUMMARY_HEADER + "⏳ ...")
+    loop = asyncio.get_running_loop()
+    text = ""
+    last_edit = loop.time()
+
+    async def consume():
+        nonlocal text, last_edit
+        async for delta in llm_service.stream_summary(context, query):
+            text += delta
+            if loop.time() - last_edit >= config.SUMMARY_EDIT_INTERVAL:
+                last_edit = loop.time()
+                await _edit_summary(summary_msg, text + " ▌")
+
+    try:
+        with metrics.timer("handler_stage_seconds", handler="handle_search", stage="summary_stream"):
+            await asyncio.wait_for(consume(), timeout=config.SUMMARY_STREAM_TIMEOUT)
+    except asyncio.TimeoutError:
+        text += "\n\n⏱ (генерация прервана по таймауту)"
+    except asyncio.CancelledError:
+        await _edit_summary(summary_msg, text + "\n\n(отменено новым запросом)")
+        raise
+    except Exception as e:
+        logger.error(f"Summary stream error: {e}")
+        if not text:
+            text = "❌ Не удалось сгенерировать резюме."
+
+    await _edit_summary(summary_msg, text.strip() or "Резюме пустое.")
+
+def _start_summary(message: Message, context: str, query: str):
+    chat_id = message.chat.id
+    previous = summary_tasks.get(chat_id)
+    if previous and not previous.done():
+        previous.cancel()
+
+    task = asyncio.create_task(stream_summary_to_chat(message, context, query))
+    summary_tasks[chat_id] = task
+
+    def cleanup(t):
+        if summary_tasks.get(chat_id) is t:
+            del summary_tasks[chat_id]
+    task.add_done_callback(cleanup)
+
 @router.message()
 async def handle_search(message: Message):
+    if not await ensure_ready(message):
+        return
     query = message.text
-    await message.bot.send_chat_action(chat_id=message.chat.id, action="typing")
+    await services.sender.send(message.chat.id, partial(message.bot.send_chat_action,
+                                                        chat_id=message.chat.id, action="typing"))
     
-    filters = user_filters.get(message.chat.id)
-    results = rag.search(query, n_results=3, filters=filters)
+    # Date and author filters are applied inside the vector store query
+    filters = search_filters(services.filters.get(message.chat.id))
+    with metrics.timer("handler_stage_seconds", handler="handle_search", stage="search"):
+        results = await services.rag.search(query, n_results=3, filters=filters)
+    # Weak matches are dropped instead of always sending three articles;
+    # lexical fast-path hits carry no similarity score but match the query terms exactly
+    results = [r for r in results if r.get('score') is None or r['score'] >= config.MIN_RELEVANCE]
+
+    # Results go out immediately; the summary streams in below them
+    with metrics.timer("handler_stage_seconds", handler="handle_search", stage="send_results"):
+        await send_search_results(message, results)
     
     # Generate AI summary if results found
-    if results and llm_service.client:
-        # Prepare context from results
-        context = "\n\n".join([f"Статья: {r['metadata']['title']}\n{r['content'][:500]}" for r in results[:2]])
+    if results and llm_service.async_client:
+        # Token-budgeted context from the most relevant chunks of the found articles.
+        # The results are already sent: a failure here only skips the summary
         try:
-            summary = llm_service.generate_summary(context, query)
-            await message.answer(f"📝 **Краткое резюме по вашему запросу:**\n\n{summary}\n\n---\n")
-        except:
-            pass  # If summary fails, just show results
-    
-    await send_search_results(message, results)
-
+            with metrics.timer("handler_stage_seconds", handler="handle_search", stage="context"):
+                context = await services.rag.build_search_context(query, results)
+        except Exception as e:
+            logger.error(f"Summary context error: {e}")
+            return
+        logger.info(f"Summary context: {context['tokens']} tokens from {context['chunks']} chunks "
+                    f"of {context['articles']} articles")
+        _start_summary(message, context['text'], query)
@@ -0,0 +1,40 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Records handler_seconds{handler=<function name>} for every handled update."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        with metrics.timer("handler_seconds", handler=name):
+            try:
+                return await handler(event, data)
+            except Exception:
+                metrics.inc("handler_errors_total", handler=name)
+                raise
+
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render_prometheus().encode("utf-8"),
+                        headers={'Content-Type': PROMETHEUS_CONTENT_TYPE})
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Standalone GET /metrics endpoint; returns the runner to clean up on shutdown."""
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return runner
@@ -1,3 +1,5 @@
+from typing import List, Tuple
+
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 
 def get_main_keyboard():
@@ -7,20 +9,32 @@ def get_main_keyboard():
     ]
     return ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
 
-def get_article_keyboard(link: str, title: str):
-    # Shorten title for callback data to avoid limit
-    short_title = title[:20] 
+def get_article_keyboard(link: str, article_id: str):
+    # Article ID is 16 hex chars, well within Telegram's 64-byte callback data limit
     kb = [
         [InlineKeyboardButton(text="Читать полностью", url=link)],
-        [InlineKeyboardButton(text="🔍 Похожие статьи", callback_data=f"similar:{short_title}")],
-        [InlineKeyboardButton(text="❓ Создать тест", callback_data=f"quiz:{short_title}")]
+        [InlineKeyboardButton(text="🔍 Похожие статьи", callback_data=f"similar:{article_id}")],
+        [InlineKeyboardButton(text="❓ Создать тест", callback_data=f"quiz:{article_id}")]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=kb)
+
+def get_results_keyboard(articles: List[Tuple[str, str]]):
+    """One row per (link, article_id) for a compact results message: link, similar, quiz."""
+    kb = [
+        [InlineKeyboardButton(text=f"📖 {idx}", url=link),
+         InlineKeyboardButton(text=f"🔍 Похожие {idx}", callback_data=f"similar:{article_id}"),
+         InlineKeyboardButton(text=f"❓ Тест {idx}", callback_data=f"quiz:{article_id}")]
+        for idx, (link, article_id) in enumerate(articles, 1)
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
 
 def get_filter_keyboard():
     kb = [
-        [InlineKeyboardButton(text="📅 За все время", callback_data="filter:date:all")],
+        [InlineKeyboardButton(text="📅 За неделю", callback_data="filter:date:week"),
+         InlineKeyboardButton(text="📅 За месяц", callback_data="filter:date:month")],
+        [InlineKeyboardButton(text="📅 За год", callback_data="filter:date:year"),
+         InlineKeyboardButton(text="📅 За все время", callback_data="filter:date:all")],
+        [InlineKeyboardButton(text="✍️ Автор", callback_data="filter:author")],
         [InlineKeyboardButton(text="❌ Сбросить фильтры", callback_data="filter:reset")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=kb)
-
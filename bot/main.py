@@ -1,3 +1,8 @@
+import time
+
+# Measured from process start of the bot module to the first polling request
+_STARTED = time.perf_counter()
+
 import asyncio
 import logging
 import sys
@@ -7,30 +12,77 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from config import config
 from bot.handlers import router
+from bot.instrumentation import HandlerTimingMiddleware, start_metrics_server
+from bot.services import services
+from core.metrics import metrics
 
-async def main():
+async def on_startup():
+    logging.info(f"Import-to-polling time: {time.perf_counter() - _STARTED:.2f}s")
+    metrics.start_log_dump(config.METRICS_LOG_INTERVAL)
+    if config.WARMUP_ON_STARTUP:
+        # Runs in the background; handlers reply "warming up" until it finishes
+        services.start_warm_up()
+
+async def on_shutdown():
+    await services.close()
+    await metrics.close()
+
+def setup_logging():
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(name)s - %(message)s",
     )
+
+def create_bot() -> Bot:
+    session = None
+    if config.TELEGRAM_API_URL:
+        # Self-hosted Bot API server, or a fake one for local load tests
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+    return Bot(token=config.BOT_TOKEN, session=session)
+
+def create_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    dp.include_router(router)
+    # Inner middlewares of the dispatcher also wrap the handlers of included routers
+    dp.message.middleware(HandlerTimingMiddleware())
+    dp.callback_query.middleware(HandlerTimingMiddleware())
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+async def main():
+    setup_logging()
     
     if not config.BOT_TOKEN:
         logging.error("BOT_TOKEN is not set in .env or config.py!")
         return
 
-    bot = Bot(token=config.BOT_TOKEN)
-    dp = Dispatcher()
-    dp.include_router(router)
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    metrics_runner = None
+    if config.METRICS_ENABLED and config.METRICS_PORT:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
 
     logging.info("Starting bot polling...")
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     try:
         if sys.platform == 'win32':
              asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        asyncio.run(main())
+        if config.BOT_MODE == "webhook":
+            from bot.webhook import run_webhook
+            run_webhook(create_bot, create_dispatcher, setup_logging)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("Bot stopped")
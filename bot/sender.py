@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from core.metrics import metrics
+from core.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SendCall = Callable[[], Awaitable[Any]]
+
+class OutboundSender:
+    """
+    Outbound Telegram API calls (sends and edits) go through one FIFO queue per
+    chat, drained by a worker that respects Telegram's limits: about one message
+    per second per chat (with small bursts) and ~30 per second across all chats.
+    Calls rejected with RetryAfter are retried after the requested delay.
+    Idle chat workers exit, so memory stays bounded by the number of active chats.
+    """
+
+    def __init__(self, chat_rate: float = 1.0, chat_burst: int = 3, global_rate: float = 30.0,
+                 max_retries: int = 3, idle_timeout: float = 30.0):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.idle_timeout = idle_timeout
+        self.global_bucket = TokenBucket(global_rate, capacity=max(global_rate, 1))
+        self._queues: Dict[int, asyncio.Queue] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.retry_after_total = 0.0
+        self.throttled = 0
+        self.throttle_wait_total = 0.0
+        self.throttle_wait_max = 0.0
+
+    async def send(self, chat_id: int, call: SendCall) -> Any:
+        """
+        Queues `call` (a coroutine factory, e.g. partial(message.answer, text))
+        for `chat_id` and returns its result once it was delivered.
+        """
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+            self._workers[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((call, future))
+        # Cancelling the caller cancels the future; the worker then skips the call
+        return await future
+
+    async def answer(self, message: Message, text: str, **kwargs) -> Message:
+        return await self.send(message.chat.id, partial(message.answer, text, **kwargs))
+
+    async def edit(self, message: Message, text: str, **kwargs) -> Any:
+        return await self.send(message.chat.id, partial(message.edit_text, text, **kwargs))
+
+    async def _worker(self, chat_id: int, queue: asyncio.Queue):
+        bucket = TokenBucket(self.chat_rate, capacity=self.chat_burst)
+        try:
+            while True:
+                try:
+                    call, future = await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if queue.empty():
+                        return
+                    continue
+                if future.done():
+                    continue
+                try:
+                    result = await self._deliver(bucket, call)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            self._queues.pop(chat_id, None)
+            self._workers.pop(chat_id, None)
+
+    async def _deliver(self, bucket: TokenBucket, call: SendCall) -> Any:
+        attempt = 0
+        while True:
+            waited = await bucket.acquire()
+            waited += await self.global_bucket.acquire()
+            if waited > 0:
+                self.throttled += 1
+                self.throttle_wait_total += waited
+                self.throttle_wait_max = max(self.throttle_wait_max, waited)
+                metrics.observe("telegram_throttle_wait_seconds", waited)
+            try:
+                with metrics.timer("telegram_call_seconds"):
+                    result = await call()
+                self.sent += 1
+                return result
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.retries += 1
+                metrics.inc("telegram_retry_after_total")
+                self.retry_after_total += e.retry_after
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    raise
+                logger.warning(f"Telegram flood limit, retrying in {e.retry_after}s (attempt {attempt})")
+                await asyncio.sleep(e.retry_after)
+            except Exception:
+                self.failed += 1
+                raise
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'active_chats': len(self._queues),
+            'queue_depth': sum(q.qsize() for q in self._queues.values()),
+            'max_chat_queue_depth': max((q.qsize() for q in self._queues.values()), default=0),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'retry_after_total': self.retry_after_total,
+            'throttled': self.throttled,
+            'throttle_wait_total': round(self.throttle_wait_total, 3),
+            'throttle_wait_max': round(self.throttle_wait_max, 3),
+        }
+
+    async def close(self):
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from config import config
+from core.file_lock import FileLock
+from core.scraper import HabrScraper
+from bot.filter_store import FilterStore
+from bot.sender import OutboundSender
+
+logger = logging.getLogger(__name__)
+
+class Services:
+    """
+    Deferred construction of the heavy services (embedding model, Chroma client).
+    Nothing is loaded at import time, so the bot can start polling immediately;
+    warm_up() builds everything in a worker thread and flips `ready`.
+    """
+
+    def __init__(self):
+        self.scraper = HabrScraper()
+        # Cheap to open, and usable while the heavy services are still warming up
+        self.filters = FilterStore(config.FILTER_STORE_PATH, config.FILTER_CACHE_SIZE)
+        # Telegram's global limit is per bot, so webhook workers split it
+        workers = config.WEB_WORKERS if config.BOT_MODE == "webhook" else 1
+        self.sender = OutboundSender(config.SEND_CHAT_RATE, config.SEND_CHAT_BURST,
+                                     config.SEND_GLOBAL_RATE / max(workers, 1), config.SEND_MAX_RETRIES)
+        self.rag = None  # AsyncRagEngine
+        self.ingestion = None  # IngestionWorker
+        self.state = "cold"  # cold -> warming -> ready | failed
+        self.warmup_seconds: Optional[float] = None
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._ingest_lock = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def _build_rag(self):
+        # Imported here: chromadb / sentence-transformers imports are slow too
+        from core.rag_engine import RagEngine
+        engine = RagEngine()
+        # One encode loads the model weights and initialises the runtime
+        engine.embed_queries(["warm-up"], lookup=False)
+        return engine
+
+    async def warm_up(self):
+        """Builds the services off the event loop. Safe to call more than once."""
+        if self.state in ("warming", "ready"):
+            return
+        self.state = "warming"
+        started = time.perf_counter()
+        logger.info("Warming up services...")
+        try:
+            from core.async_services import AsyncRagEngine
+            from core.ingestion import IngestionWorker
+
+            engine = await asyncio.to_thread(self._build_rag)
+            self.rag = AsyncRagEngine(engine)
+            # Manual triggers may arrive at any worker; the job lock keeps crawls from overlapping
+            self.ingestion = IngestionWorker(self.rag, self.scraper, lock=FileLock(config.INGEST_JOB_LOCK_PATH))
+            scheduled = self._acquire_ingest_lock()
+            self.ingestion.start(run_now=config.INGEST_ON_STARTUP and scheduled, scheduled=scheduled)
+        except Exception as e:
+            self.state = "failed"
+            logger.error(f"Service warm-up failed: {e}")
+            raise
+        self.warmup_seconds = time.perf_counter() - started
+        self.state = "ready"
+        logger.info(f"Services ready: warm-up took {self.warmup_seconds:.2f}s")
+
+    def _acquire_ingest_lock(self) -> bool:
+        """
+        With several worker processes only one should poll RSS on a schedule:
+        the one holding an exclusive lock on INGEST_LOCK_PATH (released on exit).
+        """
+        lock = FileLock(config.INGEST_LOCK_PATH)
+        if not lock.acquire(blocking=False):
+            return False
+        self._ingest_lock = lock
+        return True
+
+    def start_warm_up(self) -> asyncio.Task:
+        """Starts warm_up() in the background (or returns the running task)."""
+        if self._warmup_task is None or (self._warmup_task.done() and self.state == "failed"):
+            self.state = "cold"
+            self._warmup_task = asyncio.create_task(self.warm_up())
+            self._warmup_task.add_done_callback(_log_task_error)
+        return self._warmup_task
+
+    def stats(self) -> dict:
+        """Operational counters: outbound queue, search caches and batching."""
+        stats = {'state': self.state, 'sender': self.sender.stats(), 'filters': self.filters.stats()}
+        if self.rag:
+            stats['rag'] = self.rag.stats()
+        return stats
+
+    async def close(self):
+        if self._warmup_task and not self._warmup_task.done():
+            self._warmup_task.cancel()
+        if self.ingestion:
+            await self.ingestion.stop()
+        await self.scraper.close()
+        if self.rag:
+            await self.rag.close()
+        self.filters.close()
+        await self.sender.close()
+        if self._ingest_lock:
+            self._ingest_lock.release()
+
+def _log_task_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background warm-up error: {task.exception()}")
+
+services = Services()
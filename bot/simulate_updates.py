@@ -0,0 +1,208 @@
+"""
+Local load test of the webhook deployment with simulated Telegram updates.
+
+Runs a fake Bot API server and posts message updates to the bot's webhook, then
+reports reply latency (update posted -> first message sent to that chat) and the
+Bot API calls made. Start the bot against the fake API first, e.g.:
+
+    chroma run --path ./chroma_db --port 8000
+    BOT_MODE=webhook WEB_WORKERS=4 CHROMA_HOST=localhost TELEGRAM_API_URL=http://127.0.0.1:8081 \\
+        BOT_TOKEN=123:fake python bot/main.py
+    python -m bot.simulate_updates --chats 50 --messages 5
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = [
+    "asyncio",
+    "Как ускорить FastAPI приложение",
+    "ModuleNotFoundError",
+    "PEP 8",
+    "векторные базы данных и RAG",
+    "профилирование памяти в Python",
+    "type hints и mypy",
+    "Docker для Python сервисов",
+]
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return round(ordered[index], 4)
+
+def make_message_update(update_id: int, chat_id: int, text: str) -> Dict:
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load test'},
+            'text': text,
+        },
+    }
+
+class FakeBotAPI:
+    """
+    Minimal Bot API server: accepts any method, answers sends and edits with a
+    plausible Message, and records calls per method and per chat.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081):
+        self.host = host
+        self.port = port
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._waiters: Dict[int, List[asyncio.Future]] = defaultdict(list)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        data = await request.post()
+        if method == "getMe":
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot'}
+        elif method in ("sendMessage", "editMessageText"):
+            chat_id = int(data.get('chat_id', 0))
+            result = {
+                'message_id': int(data.get('message_id') or next(self._message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'text': data.get('text', ''),
+            }
+            if method == "sendMessage":
+                for waiter in self._waiters.pop(chat_id, []):
+                    if not waiter.done():
+                        waiter.set_result(time.perf_counter())
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def wait_for_message(self, chat_id: int) -> asyncio.Future:
+        """Future resolved with the time of the next sendMessage to `chat_id`."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id].append(future)
+        return future
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+async def wait_until_ready(session: aiohttp.ClientSession, health_url: str, timeout: float):
+    """Polls the worker health endpoint until services are warmed up."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(health_url) as resp:
+                if resp.status == 200 and (await resp.json()).get('state') == "ready":
+                    return True
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    return False
+
+async def run_load(webhook_url: str, api: FakeBotAPI, chats: int = 10, messages: int = 5,
+                   queries: List[str] = None, secret: str = None, reply_timeout: float = 30.0) -> Dict:
+    """
+    Every chat sends `messages` queries one after another (waiting for the reply),
+    all chats in parallel. Returns latency percentiles and API call counts.
+    """
+    queries = queries or DEFAULT_QUERIES
+    headers = {'X-Telegram-Bot-Api-Secret-Token': secret} if secret else {}
+    update_ids = itertools.count(1)
+    ack_latencies, reply_latencies = [], []
+    errors = Counter()
+
+    async def chat_session(session: aiohttp.ClientSession, chat_id: int):
+        for i in range(messages):
+            text = queries[(chat_id + i) % len(queries)]
+            reply = api.wait_for_message(chat_id)
+            started = time.perf_counter()
+            try:
+                async with session.post(webhook_url, json=make_message_update(next(update_ids), chat_id, text),
+                                        headers=headers) as resp:
+                    ack_latencies.append(time.perf_counter() - started)
+                    if resp.status != 200:
+                        errors[f"http_{resp.status}"] += 1
+                        continue
+                replied = await asyncio.wait_for(reply, timeout=reply_timeout)
+                reply_latencies.append(replied - started)
+            except asyncio.TimeoutError:
+                errors['reply_timeout'] += 1
+            except aiohttp.ClientError as e:
+                errors[type(e).__name__] += 1
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(chat_session(session, 1000 + c) for c in range(chats)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'chats': chats,
+        'updates': chats * messages,
+        'elapsed_sec': round(elapsed, 3),
+        'updates_per_sec': round(chats * messages / elapsed, 2) if elapsed else None,
+        'webhook_ack_sec': {'p50': percentile(ack_latencies, 50), 'p95': percentile(ack_latencies, 95)},
+        'reply_latency_sec': {
+            'p50': percentile(reply_latencies, 50),
+            'p95': percentile(reply_latencies, 95),
+            'p99': percentile(reply_latencies, 99),
+        },
+        'errors': dict(errors),
+        'api_calls': dict(api.calls),
+    }
+
+async def main_async(args):
+    api = FakeBotAPI(args.api_host, args.api_port)
+    await api.start()
+    try:
+        base = args.webhook.rsplit("/", 1)[0]
+        async with aiohttp.ClientSession() as session:
+            if not await wait_until_ready(session, base + "/healthz", args.ready_timeout):
+                logger.warning("Bot did not report ready; sending updates anyway.")
+        report = await run_load(args.webhook, api, args.chats, args.messages,
+                                secret=args.secret, reply_timeout=args.reply_timeout)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    finally:
+        await api.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Telegram updates against the webhook")
+    parser.add_argument("--webhook", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default=None, help="WEBHOOK_SECRET of the bot, if set")
+    parser.add_argument("--api-host", default="127.0.0.1")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--chats", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--ready-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import Callable
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import config
+from bot.instrumentation import start_metrics_server
+from bot.services import services
+
+logger = logging.getLogger(__name__)
+
+BotFactory = Callable[[], Bot]
+DispatcherFactory = Callable[[], Dispatcher]
+
+async def register_webhook(create_bot: BotFactory):
+    """Points Telegram at WEBHOOK_URL + WEBHOOK_PATH. Done once, before workers start."""
+    bot = create_bot()
+    try:
+        url = config.WEBHOOK_URL.rstrip("/") + config.WEBHOOK_PATH
+        await bot.set_webhook(url, secret_token=config.WEBHOOK_SECRET)
+        logger.info(f"Webhook registered: {url}")
+    finally:
+        await bot.session.close()
+
+async def health(request: web.Request) -> web.Response:
+    # Served on the public port: liveness only, detailed stats are behind /stats
+    return web.json_response({'pid': os.getpid(), 'state': services.state})
+
+async def serve(worker_id: int, create_bot: BotFactory, create_dispatcher: DispatcherFactory):
+    """
+    One webhook worker: an aiohttp server on WEBAPP_HOST:WEBAPP_PORT. With several
+    workers the port is opened with SO_REUSEPORT and the kernel spreads incoming
+    connections over the processes.
+    """
+    bot = create_bot()
+    dp = create_dispatcher()
+    app = web.Application()
+    # Updates are acknowledged right away and handled in the background
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=config.WEBHOOK_SECRET).register(
+        app, path=config.WEBHOOK_PATH
+    )
+    app.router.add_get("/healthz", health)
+    # Runs the dispatcher's startup/shutdown hooks (warm-up, services.close) with the app
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, config.WEBAPP_HOST, config.WEBAPP_PORT, reuse_port=config.WEB_WORKERS > 1)
+    await site.start()
+    logger.info(f"Webhook worker {worker_id} (pid {os.getpid()}) listening on "
+                f"{config.WEBAPP_HOST}:{config.WEBAPP_PORT}{config.WEBHOOK_PATH}")
+    # Metrics are internal: each worker serves its own series on METRICS_HOST
+    # (METRICS_PORT + worker_id), never on the public webhook port
+    metrics_runner = None
+    if config.METRICS_ENABLED and config.METRICS_PORT:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT + worker_id)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await runner.cleanup()
+
+def _worker_main(worker_id: int, create_bot: BotFactory, create_dispatcher: DispatcherFactory,
+                 setup_logging: Callable[[], None]):
+    setup_logging()
+    try:
+        asyncio.run(serve(worker_id, create_bot, create_dispatcher))
+    except KeyboardInterrupt:
+        pass
+
+def run_webhook(create_bot: BotFactory, create_dispatcher: DispatcherFactory,
+                setup_logging: Callable[[], None]):
+    """
+    Webhook deployment: registers the webhook and runs WEB_WORKERS server processes.
+    Workers share the vector store through a Chroma server (CHROMA_HOST) and chat
+    state through SQLite files on this host (filters, LLM cache, BM25 index).
+    """
+    setup_logging()
+    if not config.BOT_TOKEN:
+        logger.error("BOT_TOKEN is not set in .env or config.py!")
+        return
+    if config.WEB_WORKERS > 1 and not config.CHROMA_HOST:
+        logger.warning("Several webhook workers with an embedded Chroma store: set CHROMA_HOST "
+                       "to share one Chroma server instead.")
+    if config.WEBHOOK_URL:
+        asyncio.run(register_webhook(create_bot))
+
+    if config.WEB_WORKERS <= 1:
+        _worker_main(0, create_bot, create_dispatcher, setup_logging)
+        return
+
+    # Spawned (not forked) so each worker loads its own model and clients
+    ctx = multiprocessing.get_context("spawn")
+    workers = [
+        ctx.Process(target=_worker_main, args=(i, create_bot, create_dispatcher, setup_logging),
+                    name=f"webhook-{i}")
+        for i in range(config.WEB_WORKERS)
+    ]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
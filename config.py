@@ -6,12 +6,135 @@ load_dotenv()
 class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     CHROMA_PATH = os.path.join(os.getcwd(), "chroma_db")
+    # Shared Chroma server (`chroma run --path ./chroma_db --port 8000`); embedded store if unset
+    CHROMA_HOST = os.getenv("CHROMA_HOST")
+    CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
     # Using a small, fast model for embeddings
     EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2" 
+    # torch (reference) | onnx | onnx-int8; check drift with `python -m core.embedding_parity`
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+    EMBEDDING_ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+    # Chunk size in model tokens (0 = model's max_seq_length) and overlap between chunks
+    CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+    # Size of the precomputed "similar articles" list per article
+    ARTICLE_NEIGHBOURS_K = int(os.getenv("ARTICLE_NEIGHBOURS_K", "10"))
     
     # Habr RSS feed for tech articles
     HABR_RSS_URL = "https://habr.com/ru/rss/hubs/python/all/?fl=ru"
+
+    # polling (single process) | webhook (aiohttp server, WEB_WORKERS processes on one port)
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    # Public base URL Telegram posts updates to (webhook is registered at start if set)
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+    WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+    WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080"))
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+    # Alternative Bot API server (self-hosted, or a fake one for local load tests)
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+    # Only the process holding this lock polls RSS on a schedule
+    INGEST_LOCK_PATH = os.getenv("INGEST_LOCK_PATH", os.path.join(os.getcwd(), "ingest.lock"))
+    # Held while an ingestion job (scheduled or manual) runs in any worker process
+    INGEST_JOB_LOCK_PATH = os.getenv("INGEST_JOB_LOCK_PATH", os.path.join(os.getcwd(), "ingest_job.lock"))
+
+    # Stage timings and counters (core/metrics.py). METRICS_PORT > 0 serves GET /metrics
+    # on METRICS_HOST, separately from the webhook port (webhook worker N listens on
+    # METRICS_PORT + N). METRICS_LOG_INTERVAL > 0 logs a summary.
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_LOG_INTERVAL = float(os.getenv("METRICS_LOG_INTERVAL", "0"))
+
+    # Load the embedding model and Chroma in the background right after start
+    # (otherwise on the first request that needs them)
+    WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+    # Background ingestion: RSS poll interval (seconds) and articles per run
+    INGEST_INTERVAL = float(os.getenv("INGEST_INTERVAL", "1800"))
+    INGEST_LIMIT = int(os.getenv("INGEST_LIMIT", "20"))
+    INGEST_ON_STARTUP = os.getenv("INGEST_ON_STARTUP", "0") == "1"
+
+    # Async scraper: parallel fetches, per-host rate limit (requests/sec) and retries
+    SCRAPER_CONCURRENCY = int(os.getenv("SCRAPER_CONCURRENCY", "4"))
+    SCRAPER_RATE_PER_HOST = float(os.getenv("SCRAPER_RATE_PER_HOST", "2"))
+    SCRAPER_BURST = int(os.getenv("SCRAPER_BURST", "2"))
+    SCRAPER_MAX_RETRIES = int(os.getenv("SCRAPER_MAX_RETRIES", "3"))
+    SCRAPER_BACKOFF_BASE = float(os.getenv("SCRAPER_BACKOFF_BASE", "0.5"))
+    SCRAPER_TIMEOUT = float(os.getenv("SCRAPER_TIMEOUT", "10"))
+    SCRAPER_PARSER = os.getenv("SCRAPER_PARSER", "lxml")  # lxml | bs4
+    PARSING_FIXTURES_DIR = os.getenv("PARSING_FIXTURES_DIR", os.path.join(os.getcwd(), "fixtures", "habr"))
     
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    # Point to any OpenAI-compatible server (e.g. a local fake for testing)
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+    LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+
+    # Streaming summaries: overall timeout and minimal interval between message edits
+    SUMMARY_STREAM_TIMEOUT = float(os.getenv("SUMMARY_STREAM_TIMEOUT", "30"))
+    SUMMARY_EDIT_INTERVAL = float(os.getenv("SUMMARY_EDIT_INTERVAL", "1.5"))
+
+    # Outbound Telegram queue: messages per second per chat (with bursts), across all chats,
+    # and retries after RetryAfter. RESULTS_RENDER_MODE: compact (one message) | full
+    SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+    SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+    SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))
+    SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+    RESULTS_RENDER_MODE = os.getenv("RESULTS_RENDER_MODE", "compact")
+
+    # Telegram user IDs (comma or space separated) allowed to use /stats; empty = nobody
+    ADMIN_IDS = {int(i) for i in os.getenv("ADMIN_IDS", "").replace(",", " ").split()}
+
+    # Token budgets for LLM context and MMR relevance/diversity trade-off (1.0 = relevance only)
+    SUMMARY_CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "600"))
+    QUIZ_CONTEXT_TOKENS = int(os.getenv("QUIZ_CONTEXT_TOKENS", "800"))
+    CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+
+    # Persistent cache of LLM outputs (quizzes, summaries)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.getcwd(), "llm_cache.sqlite3"))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+    # Per-chat search filters: SQLite file and number of chats kept in memory
+    FILTER_STORE_PATH = os.getenv("FILTER_STORE_PATH", os.path.join(os.getcwd(), "chat_filters.sqlite3"))
+    FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "1024"))
+
+    # Thread pools for blocking RagEngine calls made from the bot's event loop
+    RAG_SEARCH_WORKERS = int(os.getenv("RAG_SEARCH_WORKERS", "4"))
+    RAG_INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", "1"))
+
+    # Micro-batching of concurrent query embeddings
+    EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+    EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+    # Query embedding / search result caches (entries, seconds)
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+    QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+    SEARCH_RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "1024"))
+    SEARCH_RESULT_CACHE_TTL = float(os.getenv("SEARCH_RESULT_CACHE_TTL", "600"))
+
+    # Retrieval: "hybrid" (vector + BM25 fused with reciprocal rank fusion),
+    # "vector" or "lexical". BM25 index is stored next to the Chroma data.
+    SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+    # Must be on a path shared by all worker processes; they reload it when it changes
+    BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(CHROMA_PATH, "bm25_index.json.gz"))
+    # Processes sharing the store take this lock to write chunks, neighbour lists and the BM25 file
+    STORE_LOCK_PATH = os.getenv("STORE_LOCK_PATH", BM25_INDEX_PATH + ".lock")
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    # Chunks are grouped per article: score = best chunk ("max") or sum of the top-k chunks ("sum").
+    # The first fetch is n_results * SEARCH_FETCH_FACTOR chunks, doubled while there are
+    # too few distinct articles, up to SEARCH_MAX_FETCH chunks
+    SEARCH_GROUP_AGG = os.getenv("SEARCH_GROUP_AGG", "max")
+    SEARCH_GROUP_TOP_K = int(os.getenv("SEARCH_GROUP_TOP_K", "2"))
+    SEARCH_FETCH_FACTOR = int(os.getenv("SEARCH_FETCH_FACTOR", "3"))
+    SEARCH_MAX_FETCH = int(os.getenv("SEARCH_MAX_FETCH", "96"))
+    # Results below this cosine similarity are not sent to the user
+    MIN_RELEVANCE = float(os.getenv("MIN_RELEVANCE", "0.25"))
+    # Short Latin-only queries whose terms are all in the index skip encoding
+    LEXICAL_FAST_PATH_MAX_TERMS = int(os.getenv("LEXICAL_FAST_PATH_MAX_TERMS", "3"))
 
 config = Config()
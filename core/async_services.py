@@ -0,0 +1,103 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+
+try:
+    from config import config
+    from core.rag_engine import RagEngine
+    from core.embedding_service import EmbeddingBatcher
+except ImportError:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import config
+    from core.rag_engine import RagEngine
+    from core.embedding_service import EmbeddingBatcher
+
+logger = logging.getLogger(__name__)
+
+class AsyncRagEngine:
+    """
+    Async facade over RagEngine for use from aiogram handlers.
+    Encoding and Chroma calls are blocking, so they run in bounded thread pools
+    (the model and Chroma release the GIL for the heavy parts). Ingestion has its
+    own pool so a knowledge base sync cannot starve search requests.
+    Query encoding goes through an EmbeddingBatcher, so concurrent searches
+    share one batched forward pass.
+    """
+
+    def __init__(self, rag: RagEngine, search_workers: int = None, ingest_workers: int = None):
+        self.rag = rag
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=search_workers or config.RAG_SEARCH_WORKERS, thread_name_prefix="rag-search"
+        )
+        self.ingest_executor = ThreadPoolExecutor(
+            max_workers=ingest_workers or config.RAG_INGEST_WORKERS, thread_name_prefix="rag-ingest"
+        )
+        self.batcher = EmbeddingBatcher(
+            functools.partial(rag.embed_queries, lookup=False),
+            executor=self.search_executor,
+            max_batch_size=config.EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=config.EMBED_BATCH_WAIT_MS,
+        )
+
+    async def _run(self, executor: ThreadPoolExecutor, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    async def search(self, query: str, n_results: int = 3, filters: Dict = None, mode: str = None) -> List[Dict]:
+        if not query:
+            return []
+        # Another worker process ingested articles: pick up its index, drop stale results
+        if self.rag.lexical_index_changed():
+            await self._run(self.search_executor, self.rag.reload_lexical_index)
+        # Cache lookups are cheap in-memory dict reads, fine to do on the loop
+        cached = self.rag.get_cached_results(query, n_results, filters, mode)
+        if cached is not None:
+            return cached
+        # Exact-term queries are answered from the BM25 index without encoding
+        results = await self._run(self.search_executor, self.rag.lexical_fast_path, query,
+                                  n_results=n_results, filters=filters, mode=mode)
+        if results is not None:
+            return results
+        query_embedding = self.rag.get_cached_embedding(query)
+        if query_embedding is None:
+            query_embedding = await self.batcher.embed(query)
+        return await self._run(self.search_executor, self.rag.search_by_embedding, query, query_embedding,
+                               n_results=n_results, filters=filters, mode=mode)
+
+    async def get_recommendations(self, article_title: str, n_results: int = 3) -> List[Dict]:
+        return await self._run(self.search_executor, self.rag.get_recommendations, article_title, n_results=n_results)
+
+    async def get_similar_articles(self, article_id: str, n_results: int = 3) -> Optional[List[Dict]]:
+        return await self._run(self.search_executor, self.rag.get_similar_articles, article_id, n_results=n_results)
+
+    async def get_article(self, article_id: str, include_content: bool = True) -> Optional[Dict]:
+        return await self._run(self.search_executor, self.rag.get_article, article_id, include_content=include_content)
+
+    async def build_search_context(self, query: str, results: List[Dict], token_budget: int = None) -> Dict:
+        return await self._run(self.search_executor, self.rag.build_search_context, query, results,
+                               token_budget=token_budget)
+
+    async def build_article_context(self, article_id: str, token_budget: int = None) -> Optional[Dict]:
+        return await self._run(self.search_executor, self.rag.build_article_context, article_id,
+                               token_budget=token_budget)
+
+    async def is_unchanged(self, doc: Dict) -> bool:
+        return await self._run(self.search_executor, self.rag.is_unchanged, doc)
+
+    async def add_documents(self, documents: List[Dict]) -> Dict[str, int]:
+        return await self._run(self.ingest_executor, self.rag.add_documents, documents)
+
+    def stats(self) -> Dict:
+        return {'embedding_batcher': self.batcher.stats(), 'cache': self.rag.cache_stats()}
+
+    async def close(self):
+        await self.batcher.close()
+        self.shutdown()
+
+    def shutdown(self):
+        self.search_executor.shutdown(wait=False)
+        self.ingest_executor.shutdown(wait=True)
@@ -0,0 +1,130 @@
+import re
+from typing import Iterable, Iterator, List, Tuple
+
+# Sentence ends followed by whitespace, or a blank line (paragraph break)
+_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\n\s*\n')
+
+def iter_sentence_spans(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """
+    Yields (start, end, paragraph_end) spans of sentences in `text` without
+    copying it; paragraph_end is True if a paragraph break follows the sentence.
+    """
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        if match.start() > start:
+            yield start, match.start(), '\n' in match.group()
+        start = match.end()
+    if start < len(text):
+        yield start, len(text), True
+
+def join_chunks(chunks: Iterable[Tuple[str, int, int]]) -> str:
+    """
+    Rebuilds the text from its (chunk_text, char_start, overlap_chars) in chunk
+    order: the prefix a chunk repeats from the previous one is dropped, and
+    chunks that don't overlap are joined with a space (the whitespace between
+    them is not stored).
+    """
+    parts = []
+    previous_end = None
+    for i, (chunk, start, overlap) in enumerate(chunks):
+        if i == 0:
+            parts.append(chunk)
+        elif overlap:
+            # The rest starts with the whitespace that followed the previous chunk
+            parts.append(chunk[overlap:])
+        elif start is not None and start == previous_end:
+            # Token windows of one over-long sentence can be adjacent
+            parts.append(chunk)
+        else:
+            parts.append(" " + chunk)
+        previous_end = None if start is None else start + len(chunk)
+    return "".join(parts)
+
+class TokenChunker:
+    """
+    Splits text into chunks that fit the embedding model's sequence limit,
+    measured in tokenizer tokens. Chunks end at sentence boundaries (and prefer
+    paragraph boundaries), consecutive chunks share up to `overlap_tokens` of
+    trailing sentences, and sentences longer than the limit are split by tokens.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = 0, paragraph_fill: float = 0.5):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        # Break at a paragraph end once the chunk is at least this full
+        self.paragraph_fill = paragraph_fill
+
+    @property
+    def signature(self) -> str:
+        """Identifies the chunking settings; stored with chunks to detect re-chunking."""
+        name = getattr(self.tokenizer, 'name_or_path', type(self.tokenizer).__name__)
+        return f"tokens:{name}:{self.max_tokens}:{self.overlap_tokens}"
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def _split_long(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, int]]:
+        """Splits one over-long sentence into token windows, returning text spans."""
+        encoded = self.tokenizer(text[start:end], add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoded['offset_mapping']
+        for i in range(0, len(offsets), self.max_tokens):
+            window = offsets[i:i + self.max_tokens]
+            yield start + window[0][0], start + window[-1][1], len(window)
+
+    def _spans(self, text: str) -> Iterator[Tuple[int, int, int, bool]]:
+        """Sentence spans with token counts; long sentences are pre-split."""
+        for start, end, paragraph_end in iter_sentence_spans(text):
+            tokens = self.count_tokens(text[start:end])
+            if tokens <= self.max_tokens:
+                yield start, end, tokens, paragraph_end
+            else:
+                for s, e, t in self._split_long(text, start, end):
+                    yield s, e, t, False
+                # Keep the paragraph information of the original sentence
+                if paragraph_end:
+                    yield end, end, 0, True
+
+    def iter_chunks(self, text: str) -> Iterator[Tuple[str, int]]:
+        """
+        Yields (chunk_text, token_count) lazily. Token counts are sums over
+        sentences, which is exact for WordPiece tokenizers since sentences are
+        separated by whitespace.
+        """
+        for start, end, tokens in self.iter_chunk_spans(text):
+            yield text[start:end], tokens
+
+    def iter_chunk_spans(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """
+        Same chunks as iter_chunks as (start, end, token_count) offsets into `text`.
+        A chunk starting before the previous one ended repeats that overlap.
+        """
+        window: List[Tuple[int, int, int]] = []  # (start, end, tokens) of current chunk
+        used = 0
+
+        def flush():
+            return window[0][0], window[-1][1], used
+
+        for start, end, tokens, paragraph_end in self._spans(text):
+            if tokens and used + tokens > self.max_tokens and window:
+                yield flush()
+                # Carry trailing sentences over as overlap
+                carried = []
+                carried_tokens = 0
+                for span in reversed(window):
+                    if carried_tokens + span[2] > self.overlap_tokens or carried_tokens + span[2] + tokens > self.max_tokens:
+                        break
+                    carried.insert(0, span)
+                    carried_tokens += span[2]
+                window, used = carried, carried_tokens
+
+            if tokens:
+                window.append((start, end, tokens))
+                used += tokens
+
+            if paragraph_end and window and used >= self.max_tokens * self.paragraph_fill:
+                yield flush()
+                window, used = [], 0
+
+        if window:
+            yield flush()
@@ -0,0 +1,133 @@
+import functools
+import logging
+import re
+from typing import List, Dict
+
+import numpy as np
+
+try:
+    from config import config
+except ImportError:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import config
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding():
+    """
+    tiktoken encoding for the LLM model, or None. Resolved once: tiktoken downloads
+    its BPE file on first use, so offline it fails with a network error.
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(config.LLM_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken encoding unavailable, estimating token counts instead: {e}")
+        return None
+
+def count_tokens(text: str) -> int:
+    """Token count for the LLM model (tiktoken), or a rough estimate without it."""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    # ~3 characters per token is a conservative average for mixed Russian/English text
+    return max(1, len(text) // 3)
+
+def trim_to_tokens(text: str, budget: int) -> str:
+    """Longest prefix of whole sentences that fits into `budget` tokens."""
+    if count_tokens(text) <= budget:
+        return text
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+def select_mmr(query_embedding: List[float], chunks: List[Dict], token_budget: int,
+               mmr_lambda: float = 0.7, duplicate_threshold: float = 0.95) -> List[Dict]:
+    """
+    Maximal Marginal Relevance selection under a token budget.
+    `chunks` are dicts with 'content', 'metadata' and 'embedding'; embeddings are
+    expected to be normalised (MiniLM outputs are), so dot product = cosine.
+    Selected chunks get a 'tokens' count and may have their text trimmed at a
+    sentence boundary to fit the remaining budget.
+    """
+    if not chunks:
+        return []
+    vectors = np.asarray([c['embedding'] for c in chunks], dtype=np.float32)
+    relevance = vectors @ np.asarray(query_embedding, dtype=np.float32)
+    max_sim = np.full(len(chunks), -1.0, dtype=np.float32)
+    remaining = set(range(len(chunks)))
+
+    selected = []
+    used = 0
+    while remaining and used < token_budget:
+        best = max(remaining, key=lambda i: mmr_lambda * relevance[i] - (1 - mmr_lambda) * max(max_sim[i], 0.0))
+        remaining.discard(best)
+        if max_sim[best] >= duplicate_threshold:
+            # Near-duplicate of something already selected
+            continue
+
+        text = chunks[best]['content']
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            text = trim_to_tokens(text, token_budget - used)
+            if not text:
+                continue
+            tokens = count_tokens(text)
+
+        selected.append({**chunks[best], 'content': text, 'tokens': tokens})
+        used += tokens
+        max_sim = np.maximum(max_sim, vectors @ vectors[best])
+    return selected
+
+def build_context(query_embedding: List[float], chunks: List[Dict], token_budget: int,
+                  mmr_lambda: float = None) -> Dict:
+    """
+    Assembles LLM context from the most relevant, non-redundant chunks.
+    Returns {'text', 'tokens', 'chunks', 'articles'}; 'tokens' is the actual
+    token count of the assembled text.
+    """
+    if mmr_lambda is None:
+        mmr_lambda = config.CONTEXT_MMR_LAMBDA
+    selected = select_mmr(query_embedding, chunks, token_budget, mmr_lambda)
+
+    # Group by article, keeping articles in order of their best chunk and
+    # chunks in document order, so each article reads coherently
+    articles = {}
+    for chunk in selected:
+        link = chunk['metadata'].get('link', '')
+        articles.setdefault(link, {'title': chunk['metadata'].get('title', ''), 'chunks': []})
+        articles[link]['chunks'].append(chunk)
+
+    sections = []
+    for article in articles.values():
+        article['chunks'].sort(key=lambda c: c['metadata'].get('chunk_index', 0))
+        body = "\n".join(c['content'] for c in article['chunks'])
+        sections.append(f"Статья: {article['title']}\n{body}")
+
+    text = "\n\n".join(sections)
+    return {
+        'text': text,
+        'tokens': count_tokens(text) if text else 0,
+        'chunks': len(selected),
+        'articles': len(articles),
+    }
@@ -0,0 +1,125 @@
+"""
+Parity and throughput check of embedding backends against the reference (torch).
+
+    python -m core.embedding_parity --candidates onnx onnx-int8 --samples 500
+
+Texts are sampled from the stored chunks in CHROMA_PATH (or built-in sentences if
+the collection is empty). Reports cosine drift per backend, agreement of top-k
+neighbours within the sample, and encoding throughput.
+"""
+import argparse
+import json
+import logging
+import time
+from typing import List, Dict
+
+import numpy as np
+
+try:
+    from core.rag_engine import create_embedding_backend, create_chroma_client, CHUNK_COLLECTION
+except ImportError:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from core.rag_engine import create_embedding_backend, create_chroma_client, CHUNK_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_TEXTS = [
+    "Асинхронное программирование в Python с asyncio",
+    "Как ускорить FastAPI приложение под нагрузкой",
+    "RAG: поиск по векторной базе и генерация ответов",
+    "PEP 8 и стиль кода в больших проектах",
+    "Профилирование памяти и утечки в CPython",
+    "Type hints, mypy и статический анализ",
+    "Docker-образы для Python сервисов: как уменьшить размер",
+    "Квантизация моделей и инференс на CPU",
+]
+
+def load_sample_texts(limit: int) -> List[str]:
+    try:
+        client = create_chroma_client()
+        collection = client.get_collection(name=CHUNK_COLLECTION)
+        texts = collection.get(limit=limit, include=["documents"])['documents']
+        if texts:
+            return texts
+    except Exception as e:
+        logger.warning(f"Could not read sample texts from Chroma: {e}")
+    return (FALLBACK_TEXTS * (limit // len(FALLBACK_TEXTS) + 1))[:limit]
+
+def encode_timed(backend, texts: List[str], batch_size: int, repeats: int):
+    """Returns (embeddings, texts/sec of the best run)."""
+    backend(texts[:batch_size])  # warm-up
+    best = float('inf')
+    vectors = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        out = []
+        for i in range(0, len(texts), batch_size):
+            out.extend(backend(texts[i:i + batch_size]))
+        best = min(best, time.perf_counter() - started)
+        vectors = np.asarray(out, dtype=np.float32)
+    return vectors, len(texts) / best
+
+def _normalize(v: np.ndarray) -> np.ndarray:
+    return v / np.clip(np.linalg.norm(v, axis=1, keepdims=True), 1e-12, None)
+
+def topk_agreement(reference: np.ndarray, candidate: np.ndarray, k: int = 5) -> float:
+    """Mean overlap of top-k neighbour sets (each text queried against the sample)."""
+    k = min(k, len(reference) - 1)
+    if k < 1:
+        return 1.0
+    ref_sim = reference @ reference.T
+    cand_sim = candidate @ candidate.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    ref_top = np.argsort(-ref_sim, axis=1)[:, :k]
+    cand_top = np.argsort(-cand_sim, axis=1)[:, :k]
+    overlaps = [len(set(r) & set(c)) / k for r, c in zip(ref_top, cand_top)]
+    return float(np.mean(overlaps))
+
+def compare_backends(candidates: List[str], texts: List[str], batch_size: int = 32,
+                     repeats: int = 3, reference: str = "torch") -> Dict:
+    ref_backend = create_embedding_backend(reference)
+    ref_vectors, ref_tps = encode_timed(ref_backend, texts, batch_size, repeats)
+    ref_vectors = _normalize(ref_vectors)
+    report = {
+        'samples': len(texts),
+        'batch_size': batch_size,
+        'reference': {'backend': reference, 'texts_per_sec': round(ref_tps, 1)},
+        'candidates': [],
+    }
+
+    for name in candidates:
+        backend = create_embedding_backend(name)
+        vectors, tps = encode_timed(backend, texts, batch_size, repeats)
+        vectors = _normalize(vectors)
+        cosine = np.sum(ref_vectors * vectors, axis=1)
+        drift = 1.0 - cosine
+        report['candidates'].append({
+            'backend': name,
+            'texts_per_sec': round(tps, 1),
+            'speedup': round(tps / ref_tps, 2),
+            'cosine_mean': round(float(cosine.mean()), 5),
+            'cosine_min': round(float(cosine.min()), 5),
+            'drift_p95': round(float(np.percentile(drift, 95)), 5),
+            'top5_agreement': round(topk_agreement(ref_vectors, vectors), 4),
+        })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend parity and throughput check")
+    parser.add_argument("--candidates", nargs="+", default=["onnx", "onnx-int8"])
+    parser.add_argument("--reference", default="torch")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    texts = load_sample_texts(args.samples)
+    report = compare_backends(args.candidates, texts, args.batch_size, args.repeats, args.reference)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor
+from typing import Callable, List, Dict, Optional
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBatcher:
+    """
+    Micro-batching front end for the embedding model.
+    Concurrent embed() calls are collected for up to `max_wait_ms` (or until
+    `max_batch_size` texts are queued) and encoded with a single batched call
+    in `executor`; each caller then gets its own vector back.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], List[List[float]]],
+                 executor: Optional[Executor] = None,
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        # Statistics
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._encode_total = 0.0
+
+    def _ensure_worker(self):
+        # Queue and worker are created lazily inside the running event loop
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def embed(self, text: str) -> List[float]:
+        """Returns the embedding of `text`, batched together with concurrent callers."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future, time.monotonic()))
+        return await future
+
+    async def _collect_batch(self) -> list:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            while not self._queue.empty() and len(batch) < self.max_batch_size:
+                batch.append(self._queue.get_nowait())
+            timeout = deadline - loop.time()
+            if len(batch) >= self.max_batch_size or timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            # Callers that gave up (cancelled) don't need encoding
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            started = time.monotonic()
+            # Identical concurrent queries are encoded once
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.encode_fn, texts)
+            except Exception as e:
+                logger.error(f"Batch embedding failed: {e}")
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            by_text = dict(zip(texts, vectors))
+            for text, future, enqueued in batch:
+                wait = started - enqueued
+                metrics.observe("search_stage_seconds", wait, stage="embed_queue")
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                if not future.done():
+                    future.set_result(by_text[text])
+
+            self._batches += 1
+            self._items += len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._encode_total += time.monotonic() - started
+
+    def stats(self) -> Dict[str, float]:
+        """Batch-size and queue-wait statistics since start."""
+        batches = self._batches or 1
+        items = self._items or 1
+        return {
+            'batches': self._batches,
+            'items': self._items,
+            'avg_batch_size': self._items / batches,
+            'max_batch_size': self._max_batch_seen,
+            'avg_queue_wait_ms': self._wait_total / items * 1000,
+            'max_queue_wait_ms': self._wait_max * 1000,
+            'avg_encode_ms': self._encode_total / batches * 1000,
+            'queued': self._queue.qsize() if self._queue else 0,
+        }
+
+    async def close(self):
+        if self._worker and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
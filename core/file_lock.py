@@ -0,0 +1,61 @@
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No flock (Windows): locks only exclude threads of this process
+    fcntl = None
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file (flock), shared by all processes on the host
+    that use the same path. Also excludes threads of the same process.
+
+        with FileLock(path):
+            ...
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    @property
+    def locked(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Takes the lock; with blocking=False returns False at once if it is held elsewhere."""
+        if not self._thread_lock.acquire(blocking):
+            return False
+        if fcntl is None:
+            self._file = True
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            self._thread_lock.release()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        if fcntl is not None:
+            # Closing the file drops the flock
+            self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
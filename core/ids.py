@@ -0,0 +1,7 @@
+import hashlib
+
+# Kept free of heavy imports: the bot needs article IDs before the RAG engine is loaded
+
+def make_article_id(link: str) -> str:
+    """Short stable article ID derived from the article link."""
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,204 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    from config import config
+    from core.async_services import AsyncRagEngine
+    from core.scraper import HabrScraper
+    from core.file_lock import FileLock
+    from core.metrics import metrics
+except ImportError:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import config
+    from core.async_services import AsyncRagEngine
+    from core.scraper import HabrScraper
+    from core.file_lock import FileLock
+    from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+_job_ids = itertools.count(1)
+
+class IngestionJob:
+    """One ingestion run; any number of chats can subscribe to its progress."""
+
+    def __init__(self, source: str):
+        self.id = next(_job_ids)
+        self.source = source
+        self.status = "pending"
+        self.stats: Optional[Dict[str, int]] = None
+        self.error: Optional[str] = None
+        self.created = time.monotonic()
+        # Final status message, once sent; replayed to chats that join after it
+        self.result_text: Optional[str] = None
+        self._subscribers: List[ProgressCallback] = []
+        self._replays: Set[asyncio.Task] = set()
+        self._done = asyncio.Event()
+
+    def subscribe(self, callback: ProgressCallback):
+        self._subscribers.append(callback)
+        if self.result_text is not None:
+            # The job is finishing: this chat missed the final message
+            task = asyncio.create_task(self._send(callback, self.result_text))
+            self._replays.add(task)
+            task.add_done_callback(self._replays.discard)
+
+    async def notify(self, text: str):
+        for callback in list(self._subscribers):
+            await self._send(callback, text)
+
+    async def finish(self, text: str):
+        """Sends the final status; chats subscribing from now on get it too."""
+        self.result_text = text
+        await self.notify(text)
+
+    async def _send(self, callback: ProgressCallback, text: str):
+        try:
+            await callback(text)
+        except Exception as e:
+            # A failing chat must not break the job or the other subscribers
+            logger.warning(f"Ingestion progress callback failed: {e}")
+
+    async def wait(self) -> Optional[Dict[str, int]]:
+        await self._done.wait()
+        return self.stats
+
+class IngestionWorker:
+    """
+    Background ingestion: polls the RSS feed every `interval` seconds and runs
+    manual triggers. Only one job runs at a time; triggers that arrive while a
+    job is pending or running join it instead of starting another crawl.
+    With several worker processes, `lock` (shared by all of them) extends this
+    across processes: a job that finds it held reports "already running".
+    """
+
+    def __init__(self, rag: AsyncRagEngine, scraper: HabrScraper,
+                 interval: float = None, limit: int = None, lock: FileLock = None):
+        self.rag = rag
+        self.scraper = scraper
+        self.lock = lock
+        self.interval = interval or config.INGEST_INTERVAL
+        self.limit = limit or config.INGEST_LIMIT
+        self.current: Optional[IngestionJob] = None
+        self.last_job: Optional[IngestionJob] = None
+        self.scheduled = True
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, run_now: bool = False, scheduled: bool = True):
+        """
+        Starts the worker. With scheduled=False it only runs manual triggers
+        (another process sharing the store does the periodic polling).
+        """
+        self.scheduled = scheduled
+        self._task = asyncio.create_task(self._loop())
+        if run_now:
+            self._enqueue("startup")
+        if scheduled:
+            logger.info(f"Ingestion worker started (every {self.interval:.0f}s, {self.limit} articles).")
+        else:
+            logger.info("Ingestion worker started (manual triggers only).")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _enqueue(self, source: str) -> IngestionJob:
+        if self.current is None:
+            self.current = IngestionJob(source)
+            self._wakeup.set()
+        return self.current
+
+    def trigger(self, on_progress: ProgressCallback = None) -> Tuple[IngestionJob, bool]:
+        """
+        Requests an ingestion run. Returns (job, joined): `joined` is True if the
+        request was coalesced into a job that was already pending or running.
+        """
+        joined = self.current is not None
+        job = self._enqueue("manual")
+        if on_progress:
+            job.subscribe(on_progress)
+        return job, joined
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval if self.scheduled else None)
+            except asyncio.TimeoutError:
+                self._enqueue("schedule")
+            self._wakeup.clear()
+
+            job = self.current
+            try:
+                await self._run(job)
+            finally:
+                self.last_job = job
+                self.current = None
+                job._done.set()
+
+    async def _run(self, job: IngestionJob):
+        if self.lock is None:
+            await self._ingest(job)
+            return
+        # Non-blocking, so it is safe to take on the event loop
+        if not self.lock.acquire(blocking=False):
+            job.status = "busy"
+            metrics.inc("ingest_jobs_skipped_total", source=job.source)
+            logger.info(f"Ingestion job #{job.id} ({job.source}) skipped: another process is ingesting.")
+            await job.finish("⏳ Обновление базы уже идёт в другом процессе бота. Попробуйте позже.")
+            return
+        try:
+            await self._ingest(job)
+        finally:
+            self.lock.release()
+
+    async def _ingest(self, job: IngestionJob):
+        job.status = "running"
+        started = time.monotonic()
+        logger.info(f"Ingestion job #{job.id} ({job.source}) started.")
+        try:
+            await job.notify("📡 Загружаю RSS-ленту и новые статьи...")
+            with metrics.timer("ingest_stage_seconds", stage="scrape"):
+                articles = await self.scraper.get_latest_articles_async(limit=self.limit, skip=self.rag.is_unchanged)
+            if not articles:
+                job.status = "done"
+                job.stats = {'added': 0, 'updated': 0, 'skipped': 0, 'removed': 0}
+                await job.finish("⚠️ Не удалось получить статьи или нет новых.")
+                return
+
+            fetched = sum(1 for a in articles if a.get('full_text'))
+            await job.notify(f"🧠 Получено статей: {len(articles)} (новых или изменённых: {fetched}). Индексирую...")
+            # All articles go in one call, so chunks are embedded in large batches
+            with metrics.timer("ingest_stage_seconds", stage="index"):
+                job.stats = await self.rag.add_documents(articles)
+            job.status = "done"
+            stats = job.stats
+            await job.finish(
+                f"✅ База знаний обновлена!\n"
+                f"Новых статей: {stats['added']}, обновлено: {stats['updated']}, "
+                f"без изменений: {stats['skipped']}."
+            )
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            logger.error(f"Ingestion job #{job.id} failed: {e}")
+            await job.finish("❌ Произошла ошибка при обновлении базы.")
+        finally:
+            elapsed = time.monotonic() - started
+            metrics.observe("ingest_job_seconds", elapsed, source=job.source, status=job.status)
+            logger.info(f"Ingestion job #{job.id} {job.status} in {elapsed:.1f}s: {job.stats}")
@@ -0,0 +1,266 @@
+"""
+Offline bulk import / export of the knowledge base.
+
+    python -m core.kb_cli dump articles.jsonl --limit 20     # scrape RSS into a JSONL dump
+    python -m core.kb_cli import articles.jsonl              # chunk + embed + store, resumable
+    python -m core.kb_cli export kb.npz                      # both collections with embeddings
+    python -m core.kb_cli restore kb.npz --replace           # load an export, no re-embedding
+
+Imports stream the dump and embed in batches sized to Chroma's maximum batch size.
+After every batch the byte offset is written to a checkpoint file, so an interrupted
+import continues where it stopped. Exports are compressed NumPy archives: IDs,
+embeddings, and JSON-encoded documents and metadata of every collection.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+try:
+    from config import config
+    from core.rag_engine import (RagEngine, create_chroma_client, CHUNK_COLLECTION,
+                                 ARTICLE_COLLECTION, DEFAULT_MAX_BATCH_SIZE)
+    from core.scraper import HabrScraper, write_jsonl
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import config
+    from core.rag_engine import (RagEngine, create_chroma_client, CHUNK_COLLECTION,
+                                 ARTICLE_COLLECTION, DEFAULT_MAX_BATCH_SIZE)
+    from core.scraper import HabrScraper, write_jsonl
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT = 1
+# Rough characters per model token, used to size import batches before chunking
+CHARS_PER_TOKEN = 3
+# (prefix in the archive, collection name)
+COLLECTIONS = (("chunks", CHUNK_COLLECTION), ("articles", ARTICLE_COLLECTION))
+
+# --- Import ---
+
+def iter_jsonl(path: str, offset: int = 0) -> Iterator[Tuple[Dict, int]]:
+    """Yields (article, byte offset after its line), starting at byte `offset`."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line), offset
+            except ValueError as e:
+                logger.warning(f"Skipping malformed line before byte {offset}: {e}")
+
+def load_checkpoint(path: str, source: str, chunker: str) -> Dict:
+    state = {'source': os.path.abspath(source), 'offset': 0, 'articles': 0, 'done': False,
+             'chunker': chunker, 'stats': {'added': 0, 'updated': 0, 'skipped': 0, 'removed': 0}}
+    if not os.path.exists(path):
+        return state
+    with open(path, encoding='utf-8') as f:
+        saved = json.load(f)
+    if saved.get('source') != state['source'] or saved.get('offset', 0) > os.path.getsize(source):
+        logger.warning("Checkpoint belongs to another dump, starting over.")
+        return state
+    if saved.get('chunker') != chunker:
+        # Articles already imported are re-chunked anyway (content hash includes the chunker)
+        logger.warning("Chunker settings changed since the checkpoint, starting over.")
+        return state
+    return saved
+
+def save_checkpoint(path: str, state: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def import_jsonl(rag: RagEngine, path: str, checkpoint_path: str = None, restart: bool = False,
+                 save_every: int = 10) -> Dict:
+    """
+    Imports articles (dicts with title/link/pub_date/creator/description/full_text)
+    from a JSONL dump. Batches hold about one Chroma max batch worth of chunks.
+    """
+    checkpoint_path = checkpoint_path or path + ".checkpoint.json"
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    state = load_checkpoint(checkpoint_path, path, rag.chunker.signature)
+    if state['done'] and state['offset'] >= os.path.getsize(path):
+        logger.info(f"{path} was already imported (use --restart to import it again).")
+        return state
+    # Dumps are appended to, so a finished import picks up new lines on the next run
+    state['done'] = False
+    if state['offset']:
+        logger.info(f"Resuming at byte {state['offset']} ({state['articles']} articles done).")
+
+    chunk_chars = rag.chunker.max_tokens * CHARS_PER_TOKEN
+    batch, batch_chunks, batches = [], 0, 0
+    started = time.perf_counter()
+
+    def flush(end_offset: int):
+        nonlocal batch, batch_chunks, batches
+        stats = rag.add_documents(batch, save_index=False)
+        for key, value in stats.items():
+            state['stats'][key] += value
+        state['articles'] += len(batch)
+        state['offset'] = end_offset
+        batches += 1
+        if batches % save_every == 0:
+            rag.save_lexical_index()
+        save_checkpoint(checkpoint_path, state)
+        rate = state['articles'] / (time.perf_counter() - started)
+        logger.info(f"Imported {state['articles']} articles ({rate:.1f}/s): {state['stats']}")
+        batch, batch_chunks = [], 0
+
+    offset = state['offset']
+    for doc, offset in iter_jsonl(path, state['offset']):
+        batch.append(doc)
+        batch_chunks += 1 + len(doc.get('full_text', '')) // chunk_chars
+        if batch_chunks >= rag.max_batch_size:
+            flush(offset)
+    if batch:
+        flush(offset)
+
+    rag.save_lexical_index()
+    state['done'] = True
+    save_checkpoint(checkpoint_path, state)
+    return state
+
+# --- Export / restore ---
+
+def _json_array(values) -> np.ndarray:
+    return np.frombuffer(json.dumps(values, ensure_ascii=False).encode('utf-8'), dtype=np.uint8)
+
+def _from_json_array(array: np.ndarray):
+    return json.loads(array.tobytes().decode('utf-8'))
+
+def _read_collection(collection, page_size: int) -> Dict[str, list]:
+    data = {'ids': [], 'embeddings': [], 'documents': [], 'metadatas': []}
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not page['ids']:
+            break
+        for key in data:
+            data[key].extend(page[key])
+        offset += len(page['ids'])
+    return data
+
+def export_npz(path: str, half: bool = False, page_size: int = DEFAULT_MAX_BATCH_SIZE) -> Dict:
+    """Writes both collections, embeddings included, to a compressed .npz archive."""
+    if not path.endswith(".npz"):
+        path += ".npz"  # numpy appends it anyway
+    client = create_chroma_client()
+    arrays = {}
+    counts = {}
+    chunker = None
+    for prefix, name in COLLECTIONS:
+        data = _read_collection(client.get_collection(name=name), page_size)
+        embeddings = np.asarray(data['embeddings'], dtype=np.float16 if half else np.float32)
+        arrays[f"{prefix}_ids"] = np.asarray(data['ids'], dtype=str)
+        arrays[f"{prefix}_embeddings"] = embeddings
+        arrays[f"{prefix}_documents"] = _json_array(data['documents'])
+        arrays[f"{prefix}_metadatas"] = _json_array(data['metadatas'])
+        counts[prefix] = len(data['ids'])
+        if prefix == "chunks" and data['metadatas']:
+            chunker = (data['metadatas'][0] or {}).get('chunker')
+
+    manifest = {
+        'format': EXPORT_FORMAT,
+        'embedding_model': config.EMBEDDING_MODEL,
+        'chunker': chunker,
+        'counts': counts,
+        'dtype': 'float16' if half else 'float32',
+        'exported_at': int(time.time()),
+    }
+    arrays['manifest'] = _json_array(manifest)
+    np.savez_compressed(path, **arrays)
+    logger.info(f"Exported {counts} to {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+    return manifest
+
+def restore_npz(path: str, replace: bool = False, force: bool = False) -> Dict:
+    """
+    Loads an export into the configured Chroma store without re-embedding, then
+    rebuilds the BM25 index. The embedding model must match the export.
+    """
+    archive = np.load(path)
+    manifest = _from_json_array(archive['manifest'])
+    if manifest.get('embedding_model') != config.EMBEDDING_MODEL and not force:
+        raise ValueError(f"Export was made with {manifest.get('embedding_model')}, "
+                         f"configured model is {config.EMBEDDING_MODEL} (use --force to restore anyway)")
+
+    if replace:
+        client = create_chroma_client()
+        for _, name in COLLECTIONS:
+            try:
+                client.delete_collection(name)
+            except Exception:
+                pass  # did not exist
+    # Creates the collections with the same settings the bot uses (the model is loaded but not run)
+    rag = RagEngine()
+    targets = {"chunks": rag.collection, "articles": rag.article_collection}
+    for prefix, _ in COLLECTIONS:
+        ids = archive[f"{prefix}_ids"].tolist()
+        embeddings = archive[f"{prefix}_embeddings"].astype(np.float32)
+        documents = _from_json_array(archive[f"{prefix}_documents"])
+        metadatas = _from_json_array(archive[f"{prefix}_metadatas"])
+        for start in range(0, len(ids), rag.max_batch_size):
+            end = start + rag.max_batch_size
+            targets[prefix].upsert(ids=ids[start:end], embeddings=embeddings[start:end].tolist(),
+                                   documents=documents[start:end], metadatas=metadatas[start:end])
+        logger.info(f"Restored {len(ids)} {prefix}.")
+    # Exports made before the date/author fields existed
+    rag.backfill_filter_metadata()
+    rag.rebuild_lexical_index()
+    return manifest
+
+# --- Scraper dump ---
+
+def dump_articles(path: str, limit: int) -> int:
+    scraper = HabrScraper()
+    written = write_jsonl(scraper.get_latest_articles(limit), path)
+    logger.info(f"Wrote {written} articles to {path}")
+    return written
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Knowledge base bulk import / export")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dump = commands.add_parser("dump", help="scrape the RSS feed into a JSONL dump (appends)")
+    dump.add_argument("path")
+    dump.add_argument("--limit", type=int, default=config.INGEST_LIMIT)
+
+    imp = commands.add_parser("import", help="import a JSONL dump")
+    imp.add_argument("path")
+    imp.add_argument("--checkpoint", default=None, help="default: <path>.checkpoint.json")
+    imp.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    imp.add_argument("--save-every", type=int, default=10, help="save the BM25 index every N batches")
+
+    exp = commands.add_parser("export", help="export both collections with embeddings")
+    exp.add_argument("path")
+    exp.add_argument("--half", action="store_true", help="store embeddings as float16")
+
+    res = commands.add_parser("restore", help="restore an export")
+    res.add_argument("path")
+    res.add_argument("--replace", action="store_true", help="drop existing collections first")
+    res.add_argument("--force", action="store_true", help="restore even if the model differs")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "dump":
+        dump_articles(args.path, args.limit)
+    elif args.command == "import":
+        state = import_jsonl(RagEngine(), args.path, args.checkpoint, args.restart, args.save_every)
+        print(json.dumps(state, indent=2, ensure_ascii=False))
+    elif args.command == "export":
+        print(json.dumps(export_npz(args.path, args.half), indent=2, ensure_ascii=False))
+    elif args.command == "restore":
+        print(json.dumps(restore_npz(args.path, args.replace, args.force), indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
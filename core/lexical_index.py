@@ -0,0 +1,231 @@
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Identifier-like tokens keep inner dots, dashes, pluses and hashes
+# (asyncio.gather, utf-8, c++, c#), plus their parts are indexed separately
+_TOKEN = re.compile(r"\w[\w.+#-]*[\w+#]|\w", re.UNICODE)
+_PARTS = re.compile(r"[.\-]")
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if _PARTS.search(token):
+            tokens.extend(part for part in _PARTS.split(token) if part)
+    return tokens
+
+def _file_version(stat: os.stat_result) -> Tuple[int, int]:
+    return stat.st_mtime_ns, stat.st_size
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over chunks, keyed by chunk ID.
+    Maintained alongside the Chroma collection and persisted as gzipped JSON.
+    Several processes may share the file: changes made since the last load or
+    save are kept and re-applied over a newer file, so no process overwrites
+    another's updates with a stale copy.
+    The metadata `fields` of each document are kept too, so searches can be
+    filtered without asking the vector store which chunks match.
+    """
+
+    def __init__(self, path: str = None, k1: float = 1.5, b: float = 0.75, fields: Tuple[str, ...] = ()):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.fields = tuple(fields)
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_len: Dict[str, int] = {}
+        # Terms per document, for removals; derived from postings on load
+        self.doc_terms: Dict[str, List[str]] = {}
+        # Values of `fields` per document
+        self.doc_fields: Dict[str, tuple] = {}
+        # The loaded file was saved without (these) fields: rebuild to filter
+        self.missing_fields = False
+        self.total_len = 0
+        self.dirty = False
+        # File version (mtime, size) at the last load or save, and the changes made
+        # since then: doc_id -> (text, metadata), or None if removed
+        self.file_version: Optional[Tuple[int, int]] = None
+        self._pending: Dict[str, Optional[Tuple[str, Optional[Dict]]]] = {}
+        # After clear() the next save replaces the file instead of merging into it
+        self._cleared = False
+        self._lock = threading.RLock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    def add(self, doc_id: str, text: str, metadata: Dict = None):
+        with self._lock:
+            self._add(doc_id, text, metadata)
+            self._pending[doc_id] = (text, metadata)
+
+    def _add(self, doc_id: str, text: str, metadata: Optional[Dict]):
+        self._remove(doc_id)
+        if self.fields:
+            self.doc_fields[doc_id] = tuple((metadata or {}).get(f) for f in self.fields)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_len[doc_id] = length
+        self.doc_terms[doc_id] = list(counts)
+        self.total_len += length
+        self.dirty = True
+
+    def add_many(self, items: Iterable[Tuple[str, str, Optional[Dict]]]):
+        """Adds (doc_id, text, metadata) items."""
+        for doc_id, text, metadata in items:
+            self.add(doc_id, text, metadata)
+
+    def remove(self, doc_ids: Iterable[str]):
+        with self._lock:
+            for doc_id in doc_ids:
+                self._remove(doc_id)
+                self._pending[doc_id] = None
+
+    def _remove(self, doc_id: str):
+        length = self.doc_len.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_len -= length
+        self.doc_fields.pop(doc_id, None)
+        for term in self.doc_terms.pop(doc_id, []):
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+        self.dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.postings, self.doc_len, self.doc_terms, self.doc_fields = {}, {}, {}, {}
+            self.missing_fields = False
+            self.total_len = 0
+            self._pending = {}
+            self._cleared = True
+            self.dirty = True
+
+    def contains_all(self, terms: List[str]) -> bool:
+        with self._lock:
+            return all(term in self.postings for term in terms)
+
+    def get_fields(self, doc_id: str) -> Dict:
+        """Stored metadata fields of a document ({} if unknown)."""
+        values = self.doc_fields.get(doc_id)
+        return dict(zip(self.fields, values)) if values else {}
+
+    def search(self, query: str, n_results: int = 10,
+               accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """
+        Top `n_results` (chunk_id, score) pairs for `query`. If `accept` is given,
+        only chunks it accepts are scored (e.g. a metadata filter over get_fields);
+        it is called once per chunk that contains a query term.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.doc_len)
+            if not n_docs or not terms:
+                return []
+            avg_len = self.total_len / n_docs
+            scores: Dict[str, float] = {}
+            checked: Dict[str, bool] = {}
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for doc_id, tf in docs.items():
+                    if accept is not None:
+                        accepted = checked.get(doc_id)
+                        if accepted is None:
+                            accepted = checked[doc_id] = accept(doc_id)
+                        if not accepted:
+                            continue
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+
+    def disk_version(self) -> Optional[Tuple[int, int]]:
+        try:
+            return _file_version(os.stat(self.path))
+        except (OSError, TypeError):
+            return None
+
+    def changed_on_disk(self) -> bool:
+        """True if another process saved the file since this one last loaded or saved it."""
+        version = self.disk_version()
+        return version is not None and version != self.file_version
+
+    def save(self):
+        """
+        Writes the index if it changed. If another process saved the file in the
+        meantime, its version is loaded first and the local changes re-applied on
+        top. Concurrent savers must be serialised by the caller (RagEngine holds
+        a FileLock), otherwise the last writer still wins.
+        """
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            if not self._cleared and self.changed_on_disk():
+                self.load()
+            data = {'postings': self.postings, 'doc_len': self.doc_len,
+                    'fields': list(self.fields), 'doc_fields': self.doc_fields}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Per-process temp file: several workers may save the same index
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            # Atomic replace so readers never see a half-written file
+            os.replace(tmp_path, self.path)
+            self.file_version = self.disk_version()
+            self._pending = {}
+            self._cleared = False
+            self.dirty = False
+
+    def load(self):
+        """Reads the file, then re-applies changes not saved yet."""
+        with self._lock:
+            try:
+                with open(self.path, 'rb') as raw:
+                    # Version of the file actually read, even if it is replaced meanwhile
+                    version = _file_version(os.fstat(raw.fileno()))
+                    with gzip.open(raw, 'rt', encoding='utf-8') as f:
+                        data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not load BM25 index {self.path}: {e}")
+                return
+            self.postings = data.get('postings', {})
+            self.doc_len = data.get('doc_len', {})
+            self.total_len = sum(self.doc_len.values())
+            self.doc_terms = {}
+            for term, docs in self.postings.items():
+                for doc_id in docs:
+                    self.doc_terms.setdefault(doc_id, []).append(term)
+            if data.get('fields') == list(self.fields):
+                self.doc_fields = {doc_id: tuple(values) for doc_id, values in data.get('doc_fields', {}).items()}
+                self.missing_fields = False
+            else:
+                self.doc_fields = {}
+                self.missing_fields = bool(self.fields) and bool(self.doc_len)
+            self.file_version = version
+            self._cleared = False
+            for doc_id, change in self._pending.items():
+                if change is None:
+                    self._remove(doc_id)
+                else:
+                    self._add(doc_id, *change)
+            self.dirty = bool(self._pending)
@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """
+    Persistent SQLite cache for LLM outputs with TTL and size-based (LRU) eviction.
+    Concurrent identical requests share a single in-flight call (get_or_compute,
+    stream). The async methods do the SQLite I/O in a worker thread.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_entries: int = 5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+        self._conn.commit()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Access times of hits, written with the next set() instead of a commit per hit
+        self._accessed: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, template_version: str, *parts) -> str:
+        """Cache key from model, prompt template version and the prompt inputs."""
+        h = hashlib.sha256()
+        for part in (model, template_version) + parts:
+            h.update(str(part).encode('utf-8'))
+            h.update(b'\x00')
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                metrics.inc("cache_requests_total", cache="llm", result="miss")
+                return None
+            self._accessed[key] = now
+            self.hits += 1
+            metrics.inc("cache_requests_total", cache="llm", result="hit")
+            return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            # LRU eviction needs the access times of recent hits
+            self._flush_accessed()
+            self._evict(now)
+            self._conn.commit()
+
+    def _flush_accessed(self):
+        if self._accessed:
+            self._conn.executemany("UPDATE llm_cache SET accessed = ? WHERE key = ?",
+                                   [(ts, key) for key, ts in self._accessed.items()])
+            self._accessed = {}
+
+    async def aget(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str):
+        await asyncio.to_thread(self.set, key, value)
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        count = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    async def _claim(self, key: str) -> Tuple[Optional[str], Optional[asyncio.Future]]:
+        """
+        Returns (value, None) if `key` is cached or an identical in-flight call
+        produced it, else (None, future): the caller computes the value and
+        settles the future with _finish.
+        """
+        while True:
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                cached = await self.aget(key)
+                if cached is not None:
+                    return cached, None
+                # Another request may have started the call during the read
+                inflight = self._inflight.get(key)
+            if inflight is None:
+                future = asyncio.get_running_loop().create_future()
+                self._inflight[key] = future
+                return None, future
+            metrics.inc("cache_requests_total", cache="llm", result="coalesced")
+            value = await asyncio.shield(inflight)
+            if value is not None:
+                return value, None
+            # The call was abandoned (its caller was cancelled): make our own
+
+    def _finish(self, key: str, future: asyncio.Future, value: Optional[str] = None,
+                error: Optional[BaseException] = None):
+        """Hands the outcome to the waiters. None means abandoned: they compute it themselves."""
+        self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is None or isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+            # Avoid "exception was never retrieved" when nobody else waited
+            future.exception()
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Returns the cached value or awaits `compute()` and stores its result.
+        If the same key is already being computed, waits for that call instead.
+        Exceptions are propagated to all waiters and nothing is stored.
+        """
+        value, future = await self._claim(key)
+        if future is None:
+            return value
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        try:
+            await self.aset(key, value)
+        finally:
+            self._finish(key, future, value)
+        return value
+
+    async def stream(self, key: str, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Streaming get_or_compute: yields a cached or concurrently computed value
+        in one piece, otherwise the deltas of `produce()`, whose joined text is
+        stored once the stream completes. Waiters get the final text, not deltas.
+        """
+        value, future = await self._claim(key)
+        if future is None:
+            yield value
+            return
+        parts = []
+        deltas = produce()
+        try:
+            async for delta in deltas:
+                parts.append(delta)
+                yield delta
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        finally:
+            await deltas.aclose()
+        value = "".join(parts).strip()
+        try:
+            await self.aset(key, value)
+        finally:
+            self._finish(key, future, value)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        return {'size': size, 'hits': self.hits, 'misses': self.misses, 'inflight': len(self._inflight)}
+
+    def close(self):
+        with self._lock:
+            self._flush_accessed()
+            self._conn.commit()
+            self._conn.close()
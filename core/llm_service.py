@@ -1,33 +1,107 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from typing import AsyncIterator
+import json
 import logging
 import os
 import sys
+import time
 
 try:
     from config import config
+    from core.llm_cache import LLMCache
+    from core.context_builder import trim_to_tokens
+    from core.metrics import metrics
 except ImportError:
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from config import config
+    from core.llm_cache import LLMCache
+    from core.context_builder import trim_to_tokens
+    from core.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Bump when a prompt template changes so cached outputs of the old one are not reused
+SUMMARY_PROMPT_VERSION = "summary-v1"
+QUIZ_PROMPT_VERSION = "quiz-v2"
+# Returned instead of a quiz when there is no article text to build it from
+EMPTY_QUIZ_TEXT = "Не удалось получить текст статьи для теста."
+
 class LLMService:
     def __init__(self):
         self.client = None
+        self.async_client = None
         if config.OPENAI_API_KEY:
-            self.client = OpenAI(api_key=config.OPENAI_API_KEY)
+            self.client = OpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL,
+                                 timeout=config.LLM_TIMEOUT)
+            self.async_client = AsyncOpenAI(api_key=config.OPENAI_API_KEY, base_url=config.OPENAI_BASE_URL,
+                                            timeout=config.LLM_TIMEOUT)
         else:
             logger.warning("OpenAI API key not set. LLM features will use mock responses.")
+
+        # Tokens actually billed, as reported by the API
+        self.usage = {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+        self.cache = None
+        if config.LLM_CACHE_ENABLED:
+            self.cache = LLMCache(config.LLM_CACHE_PATH, ttl=config.LLM_CACHE_TTL,
+                                  max_entries=config.LLM_CACHE_MAX_ENTRIES)
+
+    def _cache_key(self, template_version: str, messages: list, max_tokens: int, temperature: float) -> str:
+        return LLMCache.make_key(config.LLM_MODEL, template_version, max_tokens, temperature,
+                                 json.dumps(messages, ensure_ascii=False))
+
+    def _record_usage(self, usage, template_version: str, elapsed: float):
+        metrics.observe("llm_request_seconds", elapsed, prompt=template_version)
+        if usage is None:
+            return
+        self.usage['calls'] += 1
+        self.usage['prompt_tokens'] += usage.prompt_tokens or 0
+        self.usage['completion_tokens'] += usage.completion_tokens or 0
+        metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, type="prompt", prompt=template_version)
+        metrics.inc("llm_tokens_total", usage.completion_tokens or 0, type="completion", prompt=template_version)
+        logger.info(f"LLM {template_version}: {usage.prompt_tokens} prompt + "
+                    f"{usage.completion_tokens} completion tokens in {elapsed:.2f}s")
+
+    def _complete(self, messages: list, max_tokens: int, temperature: float, template_version: str) -> str:
+        key = self._cache_key(template_version, messages, max_tokens, temperature)
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        started = time.monotonic()
+        response = self.client.chat.completions.create(
+            model=config.LLM_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+        self._record_usage(response.usage, template_version, time.monotonic() - started)
+        text = response.choices[0].message.content.strip()
+        if self.cache:
+            self.cache.set(key, text)
+        return text
+
+    async def _complete_async(self, messages: list, max_tokens: int, temperature: float,
+                              template_version: str) -> str:
+        async def call():
+            started = time.monotonic()
+            response = await self.async_client.chat.completions.create(
+                model=config.LLM_MODEL,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+            self._record_usage(response.usage, template_version, time.monotonic() - started)
+            return response.choices[0].message.content.strip()
+
+        if not self.cache:
+            return await call()
+        key = self._cache_key(template_version, messages, max_tokens, temperature)
+        return await self.cache.get_or_compute(key, call)
     
-    def generate_summary(self, articles_context: str, query: str) -> str:
-        """
-        Generates a summary based on found articles.
-        """
-        if not self.client:
-            return "📝 Краткое резюме недоступно (не установлен API ключ OpenAI)."
-        
-        try:
-            prompt = f"""Ты - AI-ассистент, помогающий анализировать статьи с Хабра.
+    def _summary_messages(self, articles_context: str, query: str) -> list:
+        prompt = f"""Ты - AI-ассистент, помогающий анализировать статьи с Хабра.
 На основе следующего контекста из найденных статей, создай краткое резюме по запросу пользователя.
 
 Запрос: {query}
@@ -37,35 +111,18 @@ class LLMService:
 
 Создай краткое резюме (3-5 предложений), которое объединяет ключевые идеи из статей."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Ты - эксперт по анализу технических статей."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
-        except Exception as e:
-            logger.error(f"LLM summary error: {e}")
-            return f"❌ Ошибка генерации резюме: {str(e)}"
-    
-    def generate_quiz(self, article_title: str, article_content: str) -> str:
-        """
-        Generates a quiz based on article content.
-        """
-        if not self.client:
-            return self._mock_quiz(article_title)
-        
-        try:
-            prompt = f"""На основе следующей статьи создай короткий квиз из 3 вопросов с вариантами ответов.
+        return [
+            {"role": "system", "content": "Ты - эксперт по анализу технических статей."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _quiz_messages(self, article_title: str, article_content: str) -> list:
+        prompt = f"""На основе следующей статьи создай короткий квиз из 3 вопросов с вариантами ответов.
 
 Название статьи: {article_title}
 
 Содержание (отрывок):
-{article_content[:1500]}
+{trim_to_tokens(article_content, config.QUIZ_CONTEXT_TOKENS)}
 
 Формат ответа:
 1. Вопрос?
@@ -78,17 +135,119 @@ class LLMService:
 
 В конце укажи правильные ответы."""
 
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "Ты - создатель образовательных квизов."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.8
-            )
-            
-            return response.choices[0].message.content.strip()
+        return [
+            {"role": "system", "content": "Ты - создатель образовательных квизов."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def generate_summary(self, articles_context: str, query: str) -> str:
+        """
+        Generates a summary based on found articles.
+        """
+        if not self.client:
+            return "📝 Краткое резюме недоступно (не установлен API ключ OpenAI)."
+        
+        try:
+            return self._complete(self._summary_messages(articles_context, query),
+                                  max_tokens=300, temperature=0.7, template_version=SUMMARY_PROMPT_VERSION)
+        except Exception as e:
+            logger.error(f"LLM summary error: {e}")
+            return f"❌ Ошибка генерации резюме: {str(e)}"
+
+    async def generate_summary_async(self, articles_context: str, query: str) -> str:
+        """
+        Async version of generate_summary, does not block the event loop.
+        """
+        if not self.async_client:
+            return "📝 Краткое резюме недоступно (не установлен API ключ OpenAI)."
+
+        try:
+            return await self._complete_async(self._summary_messages(articles_context, query),
+                                              max_tokens=300, temperature=0.7,
+                                              template_version=SUMMARY_PROMPT_VERSION)
+        except Exception as e:
+            logger.error(f"LLM summary error: {e}")
+            return f"❌ Ошибка генерации резюме: {str(e)}"
+    
+    async def stream_summary(self, articles_context: str, query: str) -> AsyncIterator[str]:
+        """
+        Streams the summary as text deltas. Closing the generator (or cancelling
+        the consuming task) closes the underlying HTTP stream.
+        A cached summary is yielded at once; a fully streamed one is cached.
+        Concurrent identical requests share one stream: the others get its final text.
+        """
+        if not self.async_client:
+            yield "📝 Краткое резюме недоступно (не установлен API ключ OpenAI)."
+            return
+
+        messages = self._summary_messages(articles_context, query)
+        if self.cache:
+            key = self._cache_key(SUMMARY_PROMPT_VERSION, messages, 300, 0.7)
+            deltas = self.cache.stream(key, lambda: self._stream_completion(messages))
+        else:
+            deltas = self._stream_completion(messages)
+        try:
+            async for delta in deltas:
+                yield delta
+        finally:
+            await deltas.aclose()
+
+    async def _stream_completion(self, messages: list) -> AsyncIterator[str]:
+        started = time.monotonic()
+        stream = await self.async_client.chat.completions.create(
+            model=config.LLM_MODEL,
+            messages=messages,
+            max_tokens=300,
+            temperature=0.7,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        first = True
+        try:
+            async for chunk in stream:
+                # The final chunk carries usage and no choices
+                if getattr(chunk, 'usage', None):
+                    self._record_usage(chunk.usage, SUMMARY_PROMPT_VERSION, time.monotonic() - started)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first:
+                        first = False
+                        metrics.observe("llm_first_token_seconds", time.monotonic() - started,
+                                        prompt=SUMMARY_PROMPT_VERSION)
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+    
+    def generate_quiz(self, article_title: str, article_content: str) -> str:
+        """
+        Generates a quiz based on article content.
+        """
+        if not self.client:
+            return self._mock_quiz(article_title)
+        if not article_content.strip():
+            # Nothing to ask about; an answer made from it must not be cached
+            return EMPTY_QUIZ_TEXT
+        
+        try:
+            return self._complete(self._quiz_messages(article_title, article_content),
+                                  max_tokens=500, temperature=0.8, template_version=QUIZ_PROMPT_VERSION)
+        except Exception as e:
+            logger.error(f"LLM quiz error: {e}")
+            return self._mock_quiz(article_title)
+
+    async def generate_quiz_async(self, article_title: str, article_content: str) -> str:
+        """
+        Async version of generate_quiz, does not block the event loop.
+        Repeated quizzes for the same article come from the cache.
+        """
+        if not self.async_client:
+            return self._mock_quiz(article_title)
+        if not article_content.strip():
+            return EMPTY_QUIZ_TEXT
+
+        try:
+            return await self._complete_async(self._quiz_messages(article_title, article_content),
+                                              max_tokens=500, temperature=0.8,
+                                              template_version=QUIZ_PROMPT_VERSION)
         except Exception as e:
             logger.error(f"LLM quiz error: {e}")
             return self._mock_quiz(article_title)
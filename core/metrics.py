@@ -0,0 +1,201 @@
+"""
+In-process metrics: per-stage latency histograms and counters.
+
+    with metrics.timer("search_stage_seconds", stage="encode"):
+        ...
+    metrics.inc("chunks_embedded_total", len(chunks))
+
+Exposed in the Prometheus text format (render_prometheus(), served on /metrics)
+and as a periodic summary in the log (METRICS_LOG_INTERVAL). When disabled
+(METRICS_ENABLED=0) timer() returns a shared no-op context manager and inc() /
+observe() return immediately.
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from config import config
+except ImportError:
+    import sys
+    import os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cache hits (sub-millisecond) up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _le(bound: float) -> str:
+    return 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics) for one label set."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "started")
+
+    def __init__(self, registry: "Metrics", name: str, labels: Dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+class Metrics:
+    """
+    Registry of counters and histograms keyed by name and labels.
+    Thread-safe: RagEngine stages run in executor threads.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._lock = threading.Lock()
+        self._log_task: Optional[asyncio.Task] = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels):
+        """Context manager observing the elapsed seconds of its block."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, _le(bound))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, _le(float('inf')))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict[str, Dict]:
+        """Compact view: counters, and count/mean/p50/p95 per histogram series."""
+        result = {}
+        with self._lock:
+            for name, series in self._counters.items():
+                for key, value in series.items():
+                    result[f"{name}{_format_labels(key)}"] = value
+            for name, series in self._histograms.items():
+                for key, h in series.items():
+                    result[f"{name}{_format_labels(key)}"] = {
+                        'count': h.count,
+                        'mean': round(h.sum / h.count, 4) if h.count else None,
+                        'p50': h.quantile(0.5),
+                        'p95': h.quantile(0.95),
+                    }
+        return result
+
+    async def _log_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            for series, value in sorted(self.summary().items()):
+                logger.info(f"metric {series} {value}")
+
+    def start_log_dump(self, interval: float) -> Optional[asyncio.Task]:
+        """Logs summary() every `interval` seconds from the running event loop."""
+        if not self.enabled or interval <= 0 or self._log_task:
+            return self._log_task
+        self._log_task = asyncio.create_task(self._log_loop(interval))
+        return self._log_task
+
+    async def close(self):
+        if self._log_task:
+            self._log_task.cancel()
+            try:
+                await self._log_task
+            except asyncio.CancelledError:
+                pass
+            self._log_task = None
+
+metrics = Metrics(enabled=config.METRICS_ENABLED)
@@ -0,0 +1,177 @@
+"""
+RSS and article page parsers.
+
+The lxml parsers parse in C and extract only the needed nodes: the article body
+via targeted XPath, RSS items incrementally with a pull parser (each item is
+discarded once read). The BeautifulSoup parsers are the original implementation,
+kept as a fallback when lxml is missing or fails on a document.
+"""
+import logging
+import threading
+from typing import Dict, Iterator, List
+
+from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # optional: the bs4 parsers are used instead
+    etree = None
+    lxml_html = None
+
+logger = logging.getLogger(__name__)
+
+DC_CREATOR = "{http://purl.org/dc/elements/1.1/}creator"
+DEFAULT_CREATOR = "Habr User"
+
+ARTICLE_BODY_XPATH = "//div[@id='post-content-body']"
+ARTICLE_BODY_FALLBACK_XPATH = "//div[contains(concat(' ', normalize-space(@class), ' '), ' article-formatted-body ')]"
+
+# --- BeautifulSoup (fallback) ---
+
+def parse_rss_bs4(content: bytes) -> List[Dict]:
+    soup = BeautifulSoup(content, 'xml')
+    items = soup.find_all('item')
+
+    articles = []
+    for item in items:
+        creator = item.find('creator') or item.find('dc:creator')
+        article = {
+            'title': item.title.text if item.title else 'No Title',
+            'link': item.link.text if item.link else '',
+            'pub_date': item.pubDate.text if item.pubDate else '',
+            'description': BeautifulSoup(item.description.text, 'html.parser').get_text(separator=' ', strip=True) if item.description else '',
+            'creator': creator.text if creator else DEFAULT_CREATOR
+        }
+        articles.append(article)
+    return articles
+
+def parse_article_bs4(content: bytes) -> str:
+    """Article text, or "" if the body was not found."""
+    soup = BeautifulSoup(content, 'html.parser')
+
+    # This selector might need adjustment based on Habr's current layout
+    # Usually content is in a div with class 'article-formatted-body' or similar
+    content_div = soup.find('div', id='post-content-body')
+
+    if not content_div:
+        # Try alternative classes if ID search fails
+        content_div = soup.find('div', class_='article-formatted-body')
+
+    if content_div:
+        return content_div.get_text(separator=' ', strip=True)
+    return ""
+
+# --- lxml (fast) ---
+
+def _element_text(element) -> str:
+    """Same text as BeautifulSoup's get_text(separator=' ', strip=True), without scripts and styles."""
+    for node in element.xpath(".//script | .//style"):
+        node.drop_tree()
+    return " ".join(part.strip() for part in element.itertext() if part.strip())
+
+def _html_fragment_text(fragment: str) -> str:
+    if not fragment or not fragment.strip():
+        return ""
+    try:
+        return _element_text(lxml_html.fragment_fromstring(fragment, create_parent='div'))
+    except (etree.ParserError, ValueError):
+        return fragment.strip()
+
+class RssPullParser:
+    """
+    Incremental RSS parser: feed() the feed in chunks (e.g. as they are
+    downloaded) and read finished items as they complete.
+    """
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(events=('end',), tag='item', recover=True)
+
+    def feed(self, data: bytes) -> Iterator[Dict]:
+        self._parser.feed(data)
+        return self._read()
+
+    def close(self) -> Iterator[Dict]:
+        self._parser.close()
+        return self._read()
+
+    def _read(self) -> Iterator[Dict]:
+        for _, item in self._parser.read_events():
+            yield {
+                'title': item.findtext('title') or 'No Title',
+                'link': (item.findtext('link') or '').strip(),
+                'pub_date': item.findtext('pubDate') or '',
+                'description': _html_fragment_text(item.findtext('description') or ''),
+                'creator': item.findtext(DC_CREATOR) or item.findtext('creator') or DEFAULT_CREATOR,
+            }
+            # Drop parsed items so memory stays flat on large feeds
+            item.clear()
+            parent = item.getparent()
+            if parent is not None:
+                while item.getprevious() is not None:
+                    del parent[0]
+
+def parse_rss_lxml(content: bytes, chunk_size: int = 64 * 1024) -> List[Dict]:
+    parser = RssPullParser()
+    articles = []
+    for start in range(0, len(content), chunk_size):
+        articles.extend(parser.feed(content[start:start + chunk_size]))
+    articles.extend(parser.close())
+    return articles
+
+# lxml parsers must not be used by two threads at once (the async scraper parses in threads)
+_local = threading.local()
+
+def _html_parser(content: bytes):
+    # libxml2 assumes latin-1 for pages without a charset declaration; default to UTF-8 like bs4
+    encoding = (EncodingDetector.find_declared_encoding(content, is_html=True) or "utf-8").lower()
+    parsers = getattr(_local, "html_parsers", None)
+    if parsers is None:
+        parsers = _local.html_parsers = {}
+    if encoding not in parsers:
+        parsers[encoding] = lxml_html.HTMLParser(encoding=encoding)
+    return parsers[encoding]
+
+def parse_article_lxml(content: bytes) -> str:
+    """Article text, or "" if the body was not found."""
+    tree = lxml_html.fromstring(content, parser=_html_parser(content))
+    nodes = tree.xpath(ARTICLE_BODY_XPATH) or tree.xpath(ARTICLE_BODY_FALLBACK_XPATH)
+    return _element_text(nodes[0]) if nodes else ""
+
+PARSERS = ("lxml", "bs4")
+
+def lxml_available() -> bool:
+    return etree is not None
+
+class Parser:
+    """
+    Parser selected by name ("lxml" or "bs4"). lxml falls back to bs4 when it is
+    not installed, raises, or finds no article body in a page.
+    """
+
+    def __init__(self, name: str = "lxml"):
+        if name not in PARSERS:
+            raise ValueError(f"Unknown parser '{name}', expected one of {PARSERS}")
+        if name == "lxml" and not lxml_available():
+            logger.warning("lxml is not installed, using the BeautifulSoup parser.")
+            name = "bs4"
+        self.name = name
+
+    def parse_rss(self, content: bytes) -> List[Dict]:
+        if self.name == "lxml":
+            try:
+                return parse_rss_lxml(content)
+            except etree.LxmlError as e:
+                logger.warning(f"lxml RSS parse failed, falling back to bs4: {e}")
+        return parse_rss_bs4(content)
+
+    def parse_article(self, content: bytes) -> str:
+        if self.name == "lxml":
+            try:
+                text = parse_article_lxml(content)
+                if text:
+                    return text
+            except (etree.LxmlError, ValueError, LookupError) as e:
+                logger.warning(f"lxml article parse failed, falling back to bs4: {e}")
+        return parse_article_bs4(content)
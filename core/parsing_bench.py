@@ -0,0 +1,158 @@
+"""
+Parse throughput of the lxml and BeautifulSoup parsers on saved Habr pages.
+
+    python -m core.parsing_bench --record --pages 20     # save the RSS feed and article pages
+    python -m core.parsing_bench --repeat 5              # benchmark on the saved fixtures
+
+Fixtures are raw responses in PARSING_FIXTURES_DIR (rss.xml, article_*.html).
+Without fixtures, synthetic Habr-like pages are generated so the check runs offline.
+Reports documents/s and MB/s per parser, the speedup, and whether both parsers
+extract the same text.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+try:
+    from config import config
+    from core import parsing
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from config import config
+    from core import parsing
+
+logger = logging.getLogger(__name__)
+
+WORDS = ("python asyncio профилирование память генератор итератор декоратор контекст "
+         "менеджер поток процесс очередь база данных индекс запрос кэш сервер клиент").split()
+
+def record_fixtures(path: str, pages: int) -> int:
+    """Saves the live RSS feed and up to `pages` article pages as fixtures."""
+    import requests
+    from core.scraper import HabrScraper
+
+    os.makedirs(path, exist_ok=True)
+    scraper = HabrScraper()
+    response = requests.get(scraper.rss_url, headers=scraper.headers, timeout=10)
+    response.raise_for_status()
+    with open(os.path.join(path, "rss.xml"), "wb") as f:
+        f.write(response.content)
+
+    saved = 0
+    for i, article in enumerate(parsing.parse_rss_bs4(response.content)[:pages]):
+        time.sleep(1)  # Be polite
+        page = requests.get(article['link'], headers=scraper.headers, timeout=10)
+        if page.ok:
+            with open(os.path.join(path, f"article_{i:03d}.html"), "wb") as f:
+                f.write(page.content)
+            saved += 1
+    logger.info(f"Saved the RSS feed and {saved} pages to {path}")
+    return saved
+
+def _sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+
+def synthetic_article(rng: random.Random, paragraphs: int = 120) -> bytes:
+    """A page shaped like Habr's: large head, scripts and navigation around the post body."""
+    body = "".join(
+        f"<p>{_sentence(rng)} <code>{rng.choice(WORDS)}()</code> {_sentence(rng)}</p>"
+        if i % 7 else f"<h2>{_sentence(rng)}</h2><pre><code>def f():\n    return {i}</code></pre>"
+        for i in range(paragraphs)
+    )
+    chrome = "".join(f"<li><a href='/hub/{w}'>{w}</a></li>" for w in WORDS * 20)
+    scripts = "".join(f"<script>window.__state_{i} = {json.dumps(WORDS * 10)};</script>" for i in range(20))
+    return (
+        "<!DOCTYPE html><html><head><title>Статья</title>"
+        f"<style>.x{{color:red}}</style>{scripts}</head><body>"
+        f"<nav><ul>{chrome}</ul></nav><main><article class='tm-article'>"
+        f"<div id='post-content-body'><div class='article-formatted-body'>{body}</div></div>"
+        f"</article><aside><ul>{chrome}</ul></aside></main><footer>{chrome}</footer></body></html>"
+    ).encode("utf-8")
+
+def synthetic_rss(rng: random.Random, items: int = 40) -> bytes:
+    entries = "".join(
+        f"<item><title><![CDATA[{_sentence(rng)}]]></title>"
+        f"<link>https://habr.com/ru/articles/{800000 + i}/</link>"
+        f"<pubDate>Mon, 0{1 + i % 9} Jan 2024 10:00:00 GMT</pubDate>"
+        f"<description><![CDATA[<p>{_sentence(rng)}</p><img src='x.png'/><p>{_sentence(rng)}</p>"
+        f"<a href='https://habr.com'>Читать далее</a>]]></description>"
+        f"<dc:creator><![CDATA[user{i % 7}]]></dc:creator></item>"
+        for i in range(items)
+    )
+    return (
+        "<?xml version='1.0' encoding='UTF-8'?>"
+        "<rss version='2.0' xmlns:dc='http://purl.org/dc/elements/1.1/'><channel>"
+        f"<title>Habr</title>{entries}</channel></rss>"
+    ).encode("utf-8")
+
+def load_fixtures(path: str, synthetic_pages: int) -> Tuple[List[bytes], List[bytes], str]:
+    """Returns (rss documents, article pages, source description)."""
+    rss_path = os.path.join(path, "rss.xml")
+    pages = []
+    for page_path in sorted(glob.glob(os.path.join(path, "article_*.html"))):
+        with open(page_path, "rb") as f:
+            pages.append(f.read())
+    if pages and os.path.exists(rss_path):
+        with open(rss_path, "rb") as f:
+            return [f.read()], pages, path
+    rng = random.Random(0)
+    return [synthetic_rss(rng)], [synthetic_article(rng) for _ in range(synthetic_pages)], "synthetic"
+
+def _measure(parse: Callable, docs: List[bytes], repeat: int) -> Dict:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for doc in docs:
+            parse(doc)
+    elapsed = time.perf_counter() - started
+    total = len(docs) * repeat
+    return {
+        'docs_per_sec': round(total / elapsed, 1),
+        'mb_per_sec': round(sum(len(d) for d in docs) * repeat / elapsed / 1e6, 2),
+    }
+
+def run(docs_rss: List[bytes], pages: List[bytes], repeat: int) -> Dict:
+    cases = {
+        'article': (pages, parsing.parse_article_bs4, parsing.parse_article_lxml),
+        'rss': (docs_rss, parsing.parse_rss_bs4, parsing.parse_rss_lxml),
+    }
+    report = {}
+    for name, (docs, bs4_parse, lxml_parse) in cases.items():
+        bs4_result = _measure(bs4_parse, docs, repeat)
+        lxml_result = _measure(lxml_parse, docs, repeat)
+        same = sum(bs4_parse(doc) == lxml_parse(doc) for doc in docs)
+        report[name] = {
+            'documents': len(docs),
+            'avg_kb': round(sum(len(d) for d in docs) / len(docs) / 1024, 1),
+            'bs4': bs4_result,
+            'lxml': lxml_result,
+            'speedup': round(lxml_result['docs_per_sec'] / bs4_result['docs_per_sec'], 2),
+            'identical_output': f"{same}/{len(docs)}",
+        }
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse throughput: lxml vs BeautifulSoup")
+    parser.add_argument("--fixtures", default=config.PARSING_FIXTURES_DIR)
+    parser.add_argument("--record", action="store_true", help="save live Habr pages as fixtures first")
+    parser.add_argument("--pages", type=int, default=20, help="pages to record / synthesize")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not parsing.lxml_available():
+        parser.error("lxml is not installed")
+    if args.record:
+        record_fixtures(args.fixtures, args.pages)
+
+    docs_rss, pages, source = load_fixtures(args.fixtures, args.pages)
+    report = {'source': source, 'repeat': args.repeat, **run(docs_rss, pages, args.repeat)}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
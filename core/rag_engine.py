@@ -1,143 +1,1088 @@
 import chromadb
-from chromadb.utils import embedding_functions
+from chromadb.api.types import EmbeddingFunction
 from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Set
+import numpy as np
 import logging
-import uuid
+import hashlib
+import json
 import os
+import time
+from email.utils import parsedate_to_datetime
 
 try:
     from config import config
+    from core.cache import TTLCache
+    from core.context_builder import build_context, trim_to_tokens, count_tokens
+    from core.chunker import TokenChunker, join_chunks
+    from core.lexical_index import BM25Index, tokenize
+    from core.file_lock import FileLock
+    from core.ids import make_article_id
+    from core.metrics import metrics
 except ImportError:
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from config import config
+    from core.cache import TTLCache
+    from core.context_builder import build_context, trim_to_tokens, count_tokens
+    from core.chunker import TokenChunker, join_chunks
+    from core.lexical_index import BM25Index, tokenize
+    from core.file_lock import FileLock
+    from core.ids import make_article_id
+    from core.metrics import metrics
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def make_chunk_id(article_id: str, chunk_index: int) -> str:
+    return f"{article_id}:{chunk_index}"
+
+def _hash_text(*parts: str) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update((part or '').encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+def _to_list(vector) -> List[float]:
+    # Embedding functions may return numpy arrays
+    return vector.tolist() if hasattr(vector, 'tolist') else list(vector)
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+def _load_neighbours(meta: Dict) -> List[list]:
+    try:
+        return json.loads(meta.get('neighbors') or '[]')
+    except ValueError:
+        return []
+
+def _merge_neighbour(neighbours: List[list], article_id: str, score: float, k: int) -> List[list]:
+    """Inserts (article_id, score) into a top-k neighbour list sorted by score."""
+    merged = [n for n in neighbours if n[0] != article_id]
+    merged.append([article_id, score])
+    merged.sort(key=lambda n: n[1], reverse=True)
+    return merged[:k]
+
+def parse_pub_ts(pub_date: str) -> int:
+    """Unix timestamp of an RFC-822 RSS date (0 if missing or unparseable)."""
+    if not pub_date:
+        return 0
+    try:
+        return int(parsedate_to_datetime(pub_date).timestamp())
+    except (TypeError, ValueError, IndexError):
+        return 0
+
+def normalize_author(name: str) -> str:
+    """Author name as stored for filtering: without '@', single spaces, lower case."""
+    return " ".join((name or "").lstrip("@").split()).lower()
+
+def _fuse_rrf(rankings: List[List[str]], k: int) -> List[str]:
+    """Reciprocal rank fusion of several ranked ID lists."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def _article_key(meta: Dict) -> str:
+    # Legacy chunks have no article ID; their link identifies the article
+    return meta.get('article_id') or meta.get('link', '')
+
+def _aggregate_scores(similarities: List[float], how: str, top_k: int) -> float:
+    """Article score from its chunk similarities: best chunk, or sum of the top-k chunks."""
+    ranked = sorted(similarities, reverse=True)
+    if how == "sum":
+        return sum(ranked[:top_k])
+    return ranked[0]
+
+def rss_fingerprint(doc: Dict) -> str:
+    """Hash of the RSS fields of an article. Available before the page is fetched."""
+    return _hash_text(doc.get('title', ''), doc.get('pub_date', ''),
+                      doc.get('description', ''), doc.get('creator', ''))
+
+class EmbeddingBackend(EmbeddingFunction):
+    """
+    Reference backend: SentenceTransformer on PyTorch (CPU).
+    Backends are Chroma embedding functions but are not attached to collections:
+    RagEngine passes the embeddings to Chroma itself.
+    """
+    backend_name = "torch"
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self.model = self._load_model()
+
+    def _load_model(self) -> SentenceTransformer:
+        return SentenceTransformer(self.model_name, device="cpu")
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        vectors = self.model.encode(list(input), normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.tolist()
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self) -> int:
+        return self.model.max_seq_length
+
+class OnnxBackend(EmbeddingBackend):
+    """ONNX Runtime backend (fp32). Requires optimum[onnxruntime]."""
+    backend_name = "onnx"
+
+    def _load_model(self) -> SentenceTransformer:
+        return SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+
+class QuantizedOnnxBackend(EmbeddingBackend):
+    """
+    ONNX Runtime backend with int8 dynamically quantised weights.
+    all-MiniLM-L6-v2 ships prebuilt quantised files; EMBEDDING_ONNX_INT8_FILE picks
+    the one matching the CPU (avx2 / avx512 / arm64).
+    """
+    backend_name = "onnx-int8"
+
+    def _load_model(self) -> SentenceTransformer:
+        return SentenceTransformer(self.model_name, device="cpu", backend="onnx",
+                                   model_kwargs={"file_name": config.EMBEDDING_ONNX_INT8_FILE})
+
+EMBEDDING_BACKENDS = {cls.backend_name: cls for cls in (EmbeddingBackend, OnnxBackend, QuantizedOnnxBackend)}
+
+def create_embedding_backend(name: str = None, model_name: str = None) -> EmbeddingBackend:
+    name = name or config.EMBEDDING_BACKEND
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}', expected one of {sorted(EMBEDDING_BACKENDS)}")
+    logger.info(f"Loading embedding backend '{name}' for {model_name or config.EMBEDDING_MODEL}")
+    return EMBEDDING_BACKENDS[name](model_name)
+
+# Chunk collection and article-level vector collection
+CHUNK_COLLECTION = "habr_articles"
+ARTICLE_COLLECTION = "habr_article_vectors"
+ARTICLE_COLLECTION_METADATA = {"hnsw:space": "cosine"}
+
+# Chunk metadata kept in the BM25 index for filtered lexical search (see _lexical_filter)
+LEXICAL_FILTER_FIELDS = ("pub_ts", "author")
+# Set in the chunk collection's metadata once backfill_filter_metadata has run
+# (renamed whenever the backfill gains fields, so it runs again)
+FILTER_BACKFILL_MARKER = "filter_metadata_v2"
+# Legacy "similar:" buttons carry the first 20 characters of the title; article
+# records store that prefix so the article can be found with a `where` lookup
+TITLE_PREFIX_CHARS = 20
+
+# Chroma's limit on one add/upsert call when the client can't report it
+DEFAULT_MAX_BATCH_SIZE = 5461
+
+def get_max_batch_size(client) -> int:
+    """Largest number of records Chroma accepts in one add/upsert call."""
+    try:
+        if hasattr(client, 'get_max_batch_size'):
+            return int(client.get_max_batch_size())
+        return int(client.max_batch_size)
+    except Exception:
+        return DEFAULT_MAX_BATCH_SIZE
+
+def create_chroma_client():
+    """HTTP client for a shared Chroma server if CHROMA_HOST is set, else the embedded store."""
+    if config.CHROMA_HOST:
+        logger.info(f"Connecting to Chroma server at {config.CHROMA_HOST}:{config.CHROMA_PORT}")
+        return chromadb.HttpClient(host=config.CHROMA_HOST, port=config.CHROMA_PORT)
+    return chromadb.PersistentClient(path=config.CHROMA_PATH)
+
 class RagEngine:
     def __init__(self):
         # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(path=config.CHROMA_PATH)
+        self.chroma_client = create_chroma_client()
+        self.max_batch_size = get_max_batch_size(self.chroma_client)
         
-        # Initialize Embedding Function (using local model)
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=config.EMBEDDING_MODEL
-        )
+        # Initialize Embedding Function (local model, backend selected in Config)
+        self.embedding_fn = create_embedding_backend()
+
+        # Chunks sized in model tokens so nothing is silently truncated at encode time
+        # ([CLS] and [SEP] take two positions of max_seq_length)
+        max_tokens = config.CHUNK_MAX_TOKENS or self.embedding_fn.max_seq_length - 2
+        self.chunker = TokenChunker(self.embedding_fn.tokenizer, max_tokens, config.CHUNK_OVERLAP_TOKENS)
         
-        # Get or Create Collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name="habr_articles",
-            embedding_function=self.embedding_fn
+        # Get or Create Collection. Embeddings are always computed here and passed
+        # explicitly, so no embedding function is attached: Chroma refuses to open
+        # an existing collection with one that differs from the persisted one
+        self.collection = self.chroma_client.get_or_create_collection(name=CHUNK_COLLECTION)
+
+        # One vector per article (mean of its chunk embeddings) with a precomputed
+        # top-K neighbour list, used for "similar articles" lookups
+        self.article_collection = self.chroma_client.get_or_create_collection(
+            name=ARTICLE_COLLECTION,
+            metadata=ARTICLE_COLLECTION_METADATA
         )
+        # Neighbour lists, record metadata and the BM25 file are read-modify-write:
+        # processes sharing the store take turns writing them
+        self.store_lock = FileLock(config.STORE_LOCK_PATH)
+        if self.article_collection.count() == 0 and self.collection.count() > 0:
+            self.rebuild_article_index()
+        # Reads every record, so only until it has completed once
+        if not (self.collection.metadata or {}).get(FILTER_BACKFILL_MARKER):
+            self.backfill_filter_metadata()
+
+        # BM25 index over the same chunks, for exact identifiers (library names,
+        # error messages, PEP numbers) that dense search handles poorly
+        self.lexical_index = BM25Index(config.BM25_INDEX_PATH, fields=LEXICAL_FILTER_FIELDS)
+        if len(self.lexical_index) != self.collection.count() or self.lexical_index.missing_fields:
+            self.rebuild_lexical_index()
+        # Other processes sharing the store save the index after ingesting;
+        # its file version tells when to reload (see lexical_index_changed)
+        self._lexical_checked = time.monotonic()
+
+        # Caches for repeated queries. Results are invalidated whenever
+        # add_documents changes the collection (see collection_version).
+        self.embedding_cache = TTLCache(config.QUERY_EMBEDDING_CACHE_SIZE, config.QUERY_EMBEDDING_CACHE_TTL)
+        self.result_cache = TTLCache(config.SEARCH_RESULT_CACHE_SIZE, config.SEARCH_RESULT_CACHE_TTL)
+        self.collection_version = 0
 
-    def add_documents(self, documents: List[Dict]):
+    def _bump_version(self):
+        self.collection_version += 1
+        self.result_cache.clear()
+
+    def _get_stored_hashes(self, link: str):
+        """Returns (chunk ids, stored rss hash, stored content hash) for an article link."""
+        existing = self.collection.get(where={"link": link}, include=["metadatas"])
+        rss_hash = content_hash = None
+        for meta in existing['metadatas']:
+            if meta and meta.get('content_hash'):
+                rss_hash = meta.get('rss_hash')
+                content_hash = meta.get('content_hash')
+                break
+        return existing['ids'], rss_hash, content_hash
+
+    def is_unchanged(self, doc: Dict) -> bool:
         """
-        Adds a list of documents to the ChromaDB collection.
-        Documents must have 'full_text' and metadata.
+        Cheap pre-fetch check: True if the article is already stored and its RSS
+        fields did not change. Looks up the first chunk by its deterministic ID.
         """
+        link = doc.get('link', '')
+        if not link:
+            return False
+        stored = self.collection.get(ids=[make_chunk_id(make_article_id(link), 0)], include=["metadatas"])
+        if not stored['ids']:
+            return False
+        meta = stored['metadatas'][0] or {}
+        # Articles chunked with other settings must be fetched again to re-chunk
+        return meta.get('rss_hash') == rss_fingerprint(doc) and meta.get('chunker') == self.chunker.signature
+
+    def add_documents(self, documents: List[Dict], save_index: bool = True) -> Dict[str, int]:
+        """
+        Idempotently ingests documents into the ChromaDB collection.
+        Chunks are keyed on article link + chunk index, so re-ingesting the same
+        article overwrites it instead of adding duplicates. Unchanged articles are
+        skipped, changed ones are upserted and their leftover chunks removed.
+        Documents without 'full_text' (not fetched) are only counted as skipped
+        if they are already stored unchanged.
+
+        Chunks are written in slices of Chroma's maximum batch size. Bulk imports
+        pass save_index=False and save the BM25 index themselves now and then.
+
+        Returns counts: added/updated/skipped articles and removed chunks.
+        """
+        stats = {'added': 0, 'updated': 0, 'skipped': 0, 'removed': 0}
         ids = []
         texts = []
         metadatas = []
-        
+        stale_ids = []
+        seen_links = set()
+
         for doc in documents:
-            # Basic chunking: taking the whole text for now or first 2000 chars to avoid limits if any
-            # In a real scenario, we should use a proper chunker (RecursiveCharacterTextSplitter)
+            link = doc.get('link', '')
+            if not link or link in seen_links:
+                continue
+            seen_links.add(link)
+
+            with metrics.timer("ingest_stage_seconds", stage="hash_check"):
+                existing_ids, stored_rss_hash, stored_content_hash = self._get_stored_hashes(link)
+            rss_hash = rss_fingerprint(doc)
             text_content = doc.get('full_text', '')
+
             if not text_content:
+                if existing_ids and stored_rss_hash == rss_hash:
+                    stats['skipped'] += 1
                 continue
-                
-            # Splitting large texts into chunks could be done here.
-            # For this MVP, let's keep it simple: one article = one or a few chunks.
-            # Let's simple truncate for speed if too long, or better: just store it.
-            # Local models might have context limits (e.g. 512 tokens).
-            # SentenceTransformer handles truncation usually.
-            
-            chunk_size = 1000
-            for i in range(0, len(text_content), chunk_size):
-                chunk = text_content[i:i+chunk_size]
-                chunk_id = str(uuid.uuid4())
-                
+
+            content_hash = _hash_text(text_content, self.chunker.signature)
+            if existing_ids and stored_content_hash == content_hash and stored_rss_hash == rss_hash:
+                stats['skipped'] += 1
+                continue
+
+            article_id = make_article_id(link)
+            new_ids = set()
+            with metrics.timer("ingest_stage_seconds", stage="chunk"):
+                spans = list(self.chunker.iter_chunk_spans(text_content))
+            previous_end = 0
+            for chunk_index, (start, end, token_count) in enumerate(spans):
+                chunk_id = make_chunk_id(article_id, chunk_index)
+
+                new_ids.add(chunk_id)
                 ids.append(chunk_id)
-                texts.append(chunk)
+                texts.append(text_content[start:end])
                 metadatas.append({
                     "title": doc.get('title', ''),
-                    "link": doc.get('link', ''),
+                    "link": link,
                     "pub_date": doc.get('pub_date', ''),
                     "creator": doc.get('creator', ''),
                     "description": doc.get('description', ''),
-                    "chunk_index": i // chunk_size
+                    # Numeric date and normalised author for where-clause filters
+                    "pub_ts": parse_pub_ts(doc.get('pub_date', '')),
+                    "author": normalize_author(doc.get('creator', '')),
+                    "chunk_index": chunk_index,
+                    "token_count": token_count,
+                    # Offset in the article text and length of the prefix repeated
+                    # from the previous chunk, to rebuild the text (see get_article)
+                    "char_start": start,
+                    "overlap_chars": max(0, previous_end - start),
+                    "article_id": article_id,
+                    "rss_hash": rss_hash,
+                    "content_hash": content_hash,
+                    "chunker": self.chunker.signature
                 })
-        
+                previous_end = end
+
+            # Chunks of a longer previous version (or legacy random-ID chunks)
+            stale_ids.extend(cid for cid in existing_ids if cid not in new_ids)
+            stats['updated' if existing_ids else 'added'] += 1
+
+        embeddings = []
+        if ids:
+            with metrics.timer("ingest_stage_seconds", stage="embed"):
+                embeddings = self.embed_documents(texts)
+            metrics.inc("chunks_embedded_total", len(ids))
+        if ids or stale_ids:
+            with metrics.timer("ingest_stage_seconds", stage="store_lock"):
+                self.store_lock.acquire()
+            try:
+                # Start from the BM25 postings other processes saved meanwhile
+                if self.lexical_index.changed_on_disk():
+                    self.reload_lexical_index()
+                self._write_chunks(ids, texts, metadatas, embeddings, stale_ids)
+                if save_index:
+                    with metrics.timer("ingest_stage_seconds", stage="save_index"):
+                        self.lexical_index.save()
+            finally:
+                self.store_lock.release()
+            stats['removed'] = len(stale_ids)
+            self._bump_version()
+        for status in ('added', 'updated', 'skipped'):
+            if stats[status]:
+                metrics.inc("articles_ingested_total", stats[status], status=status)
+
+        logger.info(f"Ingested {len(ids)} chunks: {stats}")
+        return stats
+
+    def _write_chunks(self, ids: List[str], texts: List[str], metadatas: List[Dict],
+                      embeddings: List[List[float]], stale_ids: List[str]):
+        """Stores new chunks and removes stale ones everywhere. Called under store_lock."""
         if ids:
-            self.collection.add(
-                documents=texts,
-                metadatas=metadatas,
-                ids=ids
+            with metrics.timer("ingest_stage_seconds", stage="upsert"):
+                for start in range(0, len(ids), self.max_batch_size):
+                    end = start + self.max_batch_size
+                    self.collection.upsert(
+                        documents=texts[start:end],
+                        embeddings=embeddings[start:end],
+                        metadatas=metadatas[start:end],
+                        ids=ids[start:end]
+                    )
+            with metrics.timer("ingest_stage_seconds", stage="article_vectors"):
+                self._update_article_vectors(self._group_by_article(texts, embeddings, metadatas))
+            with metrics.timer("ingest_stage_seconds", stage="lexical_index"):
+                self.lexical_index.add_many(zip(ids, texts, metadatas))
+        if stale_ids:
+            with metrics.timer("ingest_stage_seconds", stage="delete"):
+                for start in range(0, len(stale_ids), self.max_batch_size):
+                    self.collection.delete(ids=stale_ids[start:start + self.max_batch_size])
+                self.lexical_index.remove(stale_ids)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Encodes chunk texts for storage."""
+        return [_to_list(v) for v in self.embedding_fn(texts)]
+
+    # --- Article-level vectors and neighbour table ---
+
+    def _group_by_article(self, texts: List[str], embeddings: List[List[float]],
+                          metadatas: List[Dict]) -> Dict[str, Dict]:
+        """Builds article records (mean chunk vector + article metadata) from chunks."""
+        grouped = {}
+        for text, embedding, meta in zip(texts, embeddings, metadatas):
+            article_id = meta.get('article_id') or make_article_id(meta.get('link', ''))
+            entry = grouped.setdefault(article_id, {'vectors': [], 'chunks': [], 'meta': meta})
+            entry['vectors'].append(embedding)
+            entry['chunks'].append((meta.get('chunk_index', 0), text))
+
+        articles = {}
+        for article_id, entry in grouped.items():
+            mean = np.mean(np.asarray(entry['vectors'], dtype=np.float32), axis=0)
+            norm = np.linalg.norm(mean)
+            if norm > 0:
+                mean = mean / norm
+            first_chunk = min(entry['chunks'])[1]
+            meta = entry['meta']
+            articles[article_id] = {
+                'embedding': mean.tolist(),
+                'document': meta.get('description') or first_chunk,
+                'metadata': {
+                    "title": meta.get('title', ''),
+                    "title_prefix": meta.get('title', '')[:TITLE_PREFIX_CHARS],
+                    "link": meta.get('link', ''),
+                    "pub_date": meta.get('pub_date', ''),
+                    "creator": meta.get('creator', ''),
+                    "description": meta.get('description', ''),
+                    "pub_ts": parse_pub_ts(meta.get('pub_date', '')),
+                    "author": normalize_author(meta.get('creator', '')),
+                    "article_id": article_id,
+                    "chunk_count": len(entry['chunks']),
+                    "neighbors": "[]"
+                }
+            }
+        return articles
+
+    def _query_neighbours(self, embedding: List[float], exclude: str) -> List[list]:
+        k = config.ARTICLE_NEIGHBOURS_K
+        n = min(k + 1, self.article_collection.count())
+        if n == 0:
+            return []
+        res = self.article_collection.query(query_embeddings=[embedding], n_results=n, include=["distances"])
+        neighbours = [
+            [nid, round(1.0 - dist, 4)]
+            for nid, dist in zip(res['ids'][0], res['distances'][0])
+            if nid != exclude
+        ]
+        return neighbours[:k]
+
+    def _lists_citing(self, article_ids: Set[str], skip: Dict, batch_size: int = 1000) -> List[str]:
+        """IDs of articles (other than those in `skip`) whose neighbour lists contain any of `article_ids`."""
+        citing = []
+        offset = 0
+        while True:
+            page = self.article_collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not page['ids']:
+                return citing
+            for aid, meta in zip(page['ids'], page['metadatas']):
+                if aid not in skip and any(n[0] in article_ids for n in _load_neighbours(meta or {})):
+                    citing.append(aid)
+            offset += len(page['ids'])
+
+    def _update_article_vectors(self, articles: Dict[str, Dict]):
+        """
+        Upserts article vectors and maintains the neighbour table incrementally:
+        each new/changed article gets a fresh top-K list, and is offered to the
+        lists of its neighbours, so existing articles don't need a full recompute.
+        Lists that cite an earlier version of a changed article are recomputed,
+        so no stale score survives there.
+        """
+        if not articles:
+            return
+        ids = list(articles)
+        existing = set(self.article_collection.get(ids=ids, include=[])['ids'])
+        self.article_collection.upsert(
+            ids=ids,
+            embeddings=[articles[a]['embedding'] for a in ids],
+            documents=[articles[a]['document'] for a in ids],
+            metadatas=[articles[a]['metadata'] for a in ids]
+        )
+
+        # Articles whose lists are recomputed from the current vectors: (embedding, metadata)
+        fresh = {aid: (articles[aid]['embedding'], articles[aid]['metadata']) for aid in ids}
+        if existing:
+            # Scans the article metadata, but only when stored articles changed
+            stale = self._lists_citing(existing, skip=articles)
+            if stale:
+                stored = self.article_collection.get(ids=stale, include=["embeddings", "metadatas"])
+                for aid, embedding, meta in zip(stored['ids'], stored['embeddings'], stored['metadatas']):
+                    fresh[aid] = (_to_list(embedding), meta)
+
+        k = config.ARTICLE_NEIGHBOURS_K
+        updates = {}  # article_id -> (metadata, neighbour list)
+        for article_id, (embedding, meta) in fresh.items():
+            neighbours = self._query_neighbours(embedding, exclude=article_id)
+            updates[article_id] = (meta, neighbours)
+            if article_id not in articles:
+                # Unchanged vector: its neighbours' lists are up to date
+                continue
+            for nid, score in neighbours:
+                if nid in fresh:
+                    # Its own query already sees this article
+                    continue
+                if nid not in updates:
+                    stored = self.article_collection.get(ids=[nid], include=["metadatas"])
+                    if not stored['ids']:
+                        continue
+                    nmeta = stored['metadatas'][0]
+                    updates[nid] = (nmeta, _load_neighbours(nmeta))
+                nmeta, current = updates[nid]
+                updates[nid] = (nmeta, _merge_neighbour(current, article_id, score, k))
+
+        update_ids = list(updates)
+        update_metas = []
+        for aid in update_ids:
+            meta, neighbours = updates[aid]
+            meta = dict(meta)
+            meta['neighbors'] = json.dumps(neighbours)
+            update_metas.append(meta)
+        self.article_collection.update(ids=update_ids, metadatas=update_metas)
+
+    def rebuild_article_index(self, batch_size: int = 1000):
+        """Recomputes article vectors and neighbour lists from the stored chunks."""
+        logger.info("Building article vectors from stored chunks...")
+        texts, embeddings, metadatas = [], [], []
+        offset = 0
+        while True:
+            page = self.collection.get(include=["documents", "embeddings", "metadatas"],
+                                       limit=batch_size, offset=offset)
+            if not page['ids']:
+                break
+            texts.extend(page['documents'])
+            embeddings.extend(_to_list(e) for e in page['embeddings'])
+            metadatas.extend(page['metadatas'])
+            offset += len(page['ids'])
+
+        articles = self._group_by_article(texts, embeddings, metadatas)
+        # Upsert everything first so each neighbour query sees the full set
+        with self.store_lock:
+            self._update_article_vectors(articles)
+        logger.info(f"Built vectors for {len(articles)} articles.")
+
+    def backfill_filter_metadata(self, batch_size: int = 1000) -> int:
+        """
+        Adds pub_ts / author metadata to chunks and article records (and title_prefix
+        to article records) stored before these fields existed. Returns the number
+        of updated records.
+        """
+        updated = 0
+        # Records are rewritten whole, so neighbour lists must not change meanwhile
+        with self.store_lock:
+            for collection in (self.collection, self.article_collection):
+                is_article = collection is self.article_collection
+                offset = 0
+                while True:
+                    page = collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+                    if not page['ids']:
+                        break
+                    ids, metas = [], []
+                    for record_id, meta in zip(page['ids'], page['metadatas']):
+                        meta = meta or {}
+                        if 'pub_ts' in meta and 'author' in meta and (not is_article or 'title_prefix' in meta):
+                            continue
+                        meta = dict(meta)
+                        meta['pub_ts'] = parse_pub_ts(meta.get('pub_date', ''))
+                        meta['author'] = normalize_author(meta.get('creator', ''))
+                        if is_article:
+                            meta['title_prefix'] = meta.get('title', '')[:TITLE_PREFIX_CHARS]
+                        ids.append(record_id)
+                        metas.append(meta)
+                    if ids:
+                        collection.update(ids=ids, metadatas=metas)
+                        updated += len(ids)
+                    offset += len(page['ids'])
+        if updated:
+            logger.info(f"Backfilled date/author/title metadata for {updated} records.")
+        self._mark_backfilled()
+        return updated
+
+    def _mark_backfilled(self):
+        metadata = dict(self.collection.metadata or {})
+        metadata[FILTER_BACKFILL_MARKER] = 1
+        try:
+            self.collection.modify(metadata=metadata)
+        except Exception as e:
+            # Only means the next start scans the records again
+            logger.warning(f"Could not record the metadata backfill marker: {e}")
+
+    def rebuild_lexical_index(self, batch_size: int = 1000):
+        """Rebuilds the BM25 index from the stored chunks (first run or after drift)."""
+        with self.store_lock:
+            # Another process may have rebuilt it while we waited for the lock
+            if self.lexical_index.changed_on_disk():
+                self.lexical_index.load()
+                if len(self.lexical_index) == self.collection.count() and not self.lexical_index.missing_fields:
+                    return
+            logger.info("Building BM25 index from stored chunks...")
+            self.lexical_index.clear()
+            offset = 0
+            while True:
+                page = self.collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+                if not page['ids']:
+                    break
+                self.lexical_index.add_many(zip(page['ids'], page['documents'], page['metadatas']))
+                offset += len(page['ids'])
+            self.lexical_index.save()
+        logger.info(f"BM25 index built for {len(self.lexical_index)} chunks.")
+
+    def save_lexical_index(self):
+        """Saves BM25 changes (bulk imports call add_documents with save_index=False)."""
+        with self.store_lock:
+            self.lexical_index.save()
+
+    def lexical_index_changed(self, interval: float = 1.0) -> bool:
+        """
+        True if another process saved a newer BM25 index (checked at most every
+        `interval` seconds, so it is cheap enough for every search).
+        """
+        now = time.monotonic()
+        if now - self._lexical_checked < interval:
+            return False
+        self._lexical_checked = now
+        return self.lexical_index.changed_on_disk()
+
+    def reload_lexical_index(self):
+        """
+        Reloads the BM25 index saved by another process and drops cached results.
+        Changes of this process that are not saved yet are kept.
+        """
+        self.lexical_index.load()
+        self._bump_version()
+        logger.info(f"Reloaded BM25 index ({len(self.lexical_index)} chunks) after external ingestion.")
+
+    def get_similar_articles(self, article_id: str, n_results: int = 3) -> Optional[List[Dict]]:
+        """
+        Returns precomputed nearest articles for `article_id` (no encoding, no ANN query).
+        None if the article has no stored vector.
+        """
+        stored = self.article_collection.get(ids=[article_id], include=["metadatas"])
+        if not stored['ids']:
+            return None
+        neighbours = _load_neighbours(stored['metadatas'][0])[:n_results]
+        if not neighbours:
+            return []
+
+        scores = dict((nid, score) for nid, score in neighbours)
+        found = self.article_collection.get(ids=list(scores), include=["documents", "metadatas"])
+        by_id = {
+            aid: {'content': doc, 'metadata': meta, 'score': scores[aid]}
+            for aid, doc, meta in zip(found['ids'], found['documents'], found['metadatas'])
+        }
+        return [by_id[nid] for nid, _ in neighbours if nid in by_id]
+
+    def embed_queries(self, texts: List[str], lookup: bool = True) -> List[List[float]]:
+        """
+        Encodes several query texts in one batched forward pass.
+        Cached embeddings are reused; lookup=False skips cache reads (the caller
+        already checked) but still stores the new vectors.
+        """
+        keys = [_normalize_query(t) for t in texts]
+        vectors = [self.embedding_cache.get(k) if lookup else None for k in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if lookup:
+            self._count_cache("query_embeddings", len(keys) - len(missing), len(missing))
+        if missing:
+            with metrics.timer("search_stage_seconds", stage="encode"):
+                encoded = self.embedding_fn([texts[i] for i in missing])
+            metrics.inc("queries_embedded_total", len(missing))
+            for i, vector in zip(missing, encoded):
+                vectors[i] = _to_list(vector)
+                self.embedding_cache.set(keys[i], vectors[i])
+        return vectors
+
+    def get_cached_embedding(self, query: str):
+        vector = self.embedding_cache.get(_normalize_query(query))
+        self._count_cache("query_embeddings", vector is not None, vector is None)
+        return vector
+
+    @staticmethod
+    def _count_cache(cache: str, hits: int, misses: int):
+        if hits:
+            metrics.inc("cache_requests_total", hits, cache=cache, result="hit")
+        if misses:
+            metrics.inc("cache_requests_total", misses, cache=cache, result="miss")
+
+    def _result_key(self, query: str, n_results: int, filters: Dict, mode: str = None):
+        filter_key = tuple(sorted((k, repr(v)) for k, v in (filters or {}).items() if v))
+        return (_normalize_query(query), n_results, filter_key, mode or config.SEARCH_MODE, self.collection_version)
+
+    def get_cached_results(self, query: str, n_results: int = 3, filters: Dict = None, mode: str = None):
+        """Returns cached search results or None."""
+        results = self.result_cache.get(self._result_key(query, n_results, filters, mode))
+        self._count_cache("search_results", results is not None, results is None)
+        return results
+
+    def _cache_results(self, query: str, n_results: int, filters: Dict, mode: str,
+                       version: int, results: List[Dict]):
+        # Don't cache results computed against a collection that changed meanwhile
+        if version == self.collection_version:
+            self.result_cache.set(self._result_key(query, n_results, filters, mode), results)
+
+    def cache_stats(self) -> Dict:
+        return {
+            'query_embeddings': self.embedding_cache.stats(),
+            'search_results': self.result_cache.stats(),
+            'collection_version': self.collection_version,
+            'lexical_index_chunks': len(self.lexical_index),
+        }
+
+    def _where(self, filters: Dict) -> Optional[Dict]:
+        """
+        Chroma where clause from search filters (None if there are none):
+        'since' / 'until' (unix time) become a range on pub_ts, 'author' matches
+        the normalised author, other keys match metadata exactly.
+        """
+        conditions = []
+        for k, v in (filters or {}).items():
+            if not v: # Only add if value is present
+                continue
+            if k == 'since':
+                conditions.append({"pub_ts": {"$gte": int(v)}})
+            elif k == 'until':
+                conditions.append({"pub_ts": {"$lt": int(v)}})
+            elif k == 'author':
+                conditions.append({"author": normalize_author(v)})
+            else:
+                conditions.append({k: v})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _filtered_ids(self, where: Optional[Dict]) -> Optional[set]:
+        """IDs of the chunks matching `where` (None if there is no filter)."""
+        if where is None:
+            return None
+        return set(self.collection.get(where=where, include=[])['ids'])
+
+    def _lexical_filter(self, filters: Dict) -> Optional[Callable[[str], bool]]:
+        """
+        Chunk predicate for BM25 search with the same conditions as _where, checked
+        against the metadata the index keeps (None if there are no filters). Only
+        chunks containing a query term are checked, so a broad filter costs nothing
+        extra. Filters on other fields fall back to asking Chroma for matching IDs.
+        """
+        active = {k: v for k, v in (filters or {}).items() if v}
+        if not active:
+            return None
+        if not set(active) <= {'since', 'until', 'author'}:
+            return self._filtered_ids(self._where(active)).__contains__
+        since = int(active['since']) if 'since' in active else None
+        until = int(active['until']) if 'until' in active else None
+        author = normalize_author(active['author']) if 'author' in active else None
+
+        def accept(chunk_id: str) -> bool:
+            fields = self.lexical_index.get_fields(chunk_id)
+            pub_ts = fields.get('pub_ts')
+            if since is not None and (pub_ts is None or pub_ts < since):
+                return False
+            if until is not None and (pub_ts is None or pub_ts >= until):
+                return False
+            return author is None or fields.get('author') == author
+        return accept
+
+    def _collect_results(self, ordered_ids: List[str], found: Dict[str, tuple], n_results: int) -> List[Dict]:
+        """Turns ranked chunk IDs into at most `n_results` results, one per article."""
+        unique_results = []
+        seen_links = set()
+        for chunk_id in ordered_ids:
+            if chunk_id not in found:
+                continue
+            doc, meta = found[chunk_id][:2]
+            link = meta['link']
+            if link not in seen_links:
+                seen_links.add(link)
+                # No query embedding on this path, hence no similarity score
+                unique_results.append({'content': doc, 'metadata': meta, 'score': None})
+                if len(unique_results) >= n_results:
+                    break
+        return unique_results
+
+    def _get_chunks(self, ids: List[str], with_embeddings: bool = False) -> Dict[str, tuple]:
+        """Fetches (document, metadata[, embedding]) of chunks by ID."""
+        if not ids:
+            return {}
+        include = ["documents", "metadatas", "embeddings"] if with_embeddings else ["documents", "metadatas"]
+        res = self.collection.get(ids=ids, include=include)
+        columns = [res['ids'], res['documents'], res['metadatas']]
+        if with_embeddings:
+            columns.append(res['embeddings'])
+        return {row[0]: tuple(row[1:]) for row in zip(*columns)}
+
+    def _query_grouped(self, query_embedding: List[float], n_results: int,
+                       where: Optional[Dict]) -> Dict[str, Dict[str, tuple]]:
+        """
+        Vector search grouped by article: article key -> {chunk_id: (similarity, doc, meta)}.
+        Starts with n_results * SEARCH_FETCH_FACTOR chunks and doubles the fetch
+        until there are n_results distinct articles, the matching chunks run out
+        or SEARCH_MAX_FETCH is reached, so one long article can't crowd out the rest.
+        """
+        fetch = max(n_results * config.SEARCH_FETCH_FACTOR, 1)
+        while True:
+            fetch = min(fetch, config.SEARCH_MAX_FETCH)
+            res = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=fetch,
+                where=where,
+                include=["documents", "metadatas", "distances"]
             )
-            logger.info(f"Added {len(ids)} chunks to the database.")
+            ids = res['ids'][0] if res['ids'] else []
+            groups = {}
+            for cid, doc, meta, dist in zip(ids, res['documents'][0], res['metadatas'][0], res['distances'][0]):
+                # Squared L2 distance between normalised vectors: cosine = 1 - d / 2
+                groups.setdefault(_article_key(meta), {})[cid] = (1.0 - dist / 2, doc, meta)
+            if len(groups) >= n_results or len(ids) < fetch or fetch >= config.SEARCH_MAX_FETCH:
+                return groups
+            logger.debug(f"Only {len(groups)} articles in {fetch} chunks, widening the search")
+            fetch *= 2
+
+    def _lexical_grouped(self, query: str, n_results: int, accept: Optional[Callable[[str], bool]],
+                         known: Dict[str, str] = None, with_embeddings: bool = False):
+        """
+        BM25 counterpart of _query_grouped: returns (ranked chunk IDs, fetched chunks).
+        The fetch widens the same way until the hits cover n_results distinct articles.
+        Chunks in `known` (chunk_id -> article key) are counted but not fetched again.
+        """
+        known = known or {}
+        found: Dict[str, tuple] = {}
+        fetch = max(n_results * config.SEARCH_FETCH_FACTOR, 1)
+        while True:
+            fetch = min(fetch, config.SEARCH_MAX_FETCH)
+            ranked = [cid for cid, _ in self.lexical_index.search(query, fetch, accept)]
+            found.update(self._get_chunks([cid for cid in ranked if cid not in known and cid not in found],
+                                          with_embeddings))
+            articles = {known[cid] if cid in known else _article_key(found[cid][1])
+                        for cid in ranked if cid in known or cid in found}
+            if len(articles) >= n_results or len(ranked) < fetch or fetch >= config.SEARCH_MAX_FETCH:
+                return ranked, found
+            logger.debug(f"Only {len(articles)} articles in {fetch} BM25 hits, widening the search")
+            fetch *= 2
+
+    def _grouped_results(self, groups: Dict[str, Dict[str, tuple]], order: List[str],
+                         n_results: int) -> List[Dict]:
+        """Builds results for the first `n_results` articles of `order` from their best chunk."""
+        results = []
+        for key in order[:n_results]:
+            chunks = groups[key]
+            best_id = max(chunks, key=lambda cid: chunks[cid][0])
+            similarity, doc, meta = chunks[best_id]
+            results.append({
+                'content': doc,
+                'metadata': meta,
+                'score': round(similarity, 4),
+                'matched_chunks': len(chunks),
+            })
+        return results
+
+    def is_lexical_query(self, query: str) -> bool:
+        """
+        True for short exact-term queries (identifiers, error names, PEP numbers):
+        Latin-only, at most LEXICAL_FAST_PATH_MAX_TERMS words, every term indexed.
+        """
+        words = query.split()
+        if not words or len(words) > config.LEXICAL_FAST_PATH_MAX_TERMS or not query.isascii():
+            return False
+        return self.lexical_index.contains_all(tokenize(query))
 
-    def search(self, query: str, n_results: int = 3, filters: Dict = None) -> List[Dict]:
+    def search_lexical(self, query: str, n_results: int = 3, filters: Dict = None) -> List[Dict]:
+        """BM25-only search. No encoding; does not touch the result cache."""
+        try:
+            # Filters restrict the scored chunks rather than the top hits afterwards
+            ordered_ids, found = self._lexical_grouped(query, n_results, self._lexical_filter(filters))
+        except Exception as e:
+            logger.error(f"Lexical search failed: {e}")
+            return []
+        return self._collect_results(ordered_ids, found, n_results)
+
+    def lexical_fast_path(self, query: str, n_results: int = 3, filters: Dict = None,
+                          mode: str = None) -> Optional[List[Dict]]:
+        """
+        Answers `query` from the BM25 index alone if the mode allows it and the query
+        looks like an exact-term lookup. Returns None if encoding is needed after all
+        (not a lexical query, or too few matching articles).
         """
-        Searches for relevant documents using semantic search.
-        Supports filtering by metadata (e.g. {'creator': 'Author Name'}).
+        mode = mode or config.SEARCH_MODE
+        if mode == "vector" or (mode != "lexical" and not self.is_lexical_query(query)):
+            return None
+        version = self.collection_version
+        with metrics.timer("search_stage_seconds", stage="lexical"):
+            results = self.search_lexical(query, n_results, filters)
+        if mode != "lexical" and len(results) < n_results:
+            return None
+        self._cache_results(query, n_results, filters, mode, version, results)
+        return results
+
+    def search(self, query: str, n_results: int = 3, filters: Dict = None, mode: str = None) -> List[Dict]:
+        """
+        Searches for relevant documents: semantic, lexical (BM25) or hybrid
+        depending on `mode` (SEARCH_MODE by default).
+        Supports filtering by metadata, pushed down into the where clause
+        (e.g. {'author': 'Author Name', 'since': unix_time}, see _where).
         """
         if not query:
             return []
-            
-        # Prepare chroma where clause
-        where_clause = {}
-        if filters:
-            for k, v in filters.items():
-                if v: # Only add if value is present
-                    where_clause[k] = v
-        
-        # If where_clause is empty, pass None
-        where_arg = where_clause if where_clause else None
+        if self.lexical_index_changed():
+            self.reload_lexical_index()
+
+        cached = self.get_cached_results(query, n_results, filters, mode)
+        if cached is not None:
+            return cached
+
+        results = self.lexical_fast_path(query, n_results, filters, mode)
+        if results is not None:
+            return results
 
         try:
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=n_results * 2, # Fetch more to deduplicate
-                where=where_arg
-            )
+            query_embedding = self.embed_queries([query])[0]
+        except Exception as e:
+            logger.error(f"Query encoding failed: {e}")
+            return []
+        return self.search_by_embedding(query, query_embedding, n_results, filters, mode)
+
+    def search_by_embedding(self, query: str, query_embedding: List[float],
+                            n_results: int = 3, filters: Dict = None, mode: str = None) -> List[Dict]:
+        """
+        Same as search, with a precomputed query embedding (e.g. from EmbeddingBatcher).
+        Chunks are grouped per article and articles ranked by SEARCH_GROUP_AGG
+        (best chunk or sum of the top SEARCH_GROUP_TOP_K chunks); in hybrid mode this
+        ranking is fused with the BM25 article ranking (RRF). Each result has a
+        'score': cosine similarity of its best chunk to the query.
+        Does not read the result cache (callers check get_cached_results first) but fills it.
+        """
+        mode = mode or config.SEARCH_MODE
+        version = self.collection_version
+        where_arg = self._where(filters)
+
+        try:
+            # Chroma applies the where clause to the vector query itself,
+            # the BM25 index checks its own copy of the filter fields
+            accept = self._lexical_filter(filters) if mode == "hybrid" else None
+            with metrics.timer("search_stage_seconds", stage="vector_query"):
+                groups = self._query_grouped(query_embedding, n_results, where_arg)
         except Exception as e:
             logger.error(f"Search failed: {e}")
             return []
-        
-        unique_results = []
-        seen_links = set()
-        
-        if results['documents']:
-            docs = results['documents'][0]
-            metas = results['metadatas'][0]
-            
-            for i in range(len(docs)):
-                link = metas[i]['link']
-                if link not in seen_links:
-                    seen_links.add(link)
-                    unique_results.append({
-                        'content': docs[i],
-                        'metadata': metas[i]
-                    })
-                    if len(unique_results) >= n_results:
-                        break
-        
+
+        lexical_order = []
+        if mode == "hybrid":
+            with metrics.timer("search_stage_seconds", stage="hybrid"):
+                known = {cid: key for key, chunks in groups.items() for cid in chunks}
+                try:
+                    lexical_ids, found = self._lexical_grouped(query, n_results, accept, known, with_embeddings=True)
+                except Exception as e:
+                    logger.error(f"Lexical search failed: {e}")
+                    lexical_ids, found = [], {}
+                query_vector = np.asarray(query_embedding, dtype=np.float32)
+                for cid, (doc, meta, embedding) in found.items():
+                    similarity = float(np.dot(query_vector, np.asarray(embedding, dtype=np.float32)))
+                    groups.setdefault(_article_key(meta), {})[cid] = (similarity, doc, meta)
+                chunk_article = {cid: key for key, chunks in groups.items() for cid in chunks}
+                lexical_order = list(dict.fromkeys(chunk_article[cid] for cid in lexical_ids if cid in chunk_article))
+
+        with metrics.timer("search_stage_seconds", stage="rank"):
+            article_scores = {
+                key: _aggregate_scores([c[0] for c in chunks.values()], config.SEARCH_GROUP_AGG, config.SEARCH_GROUP_TOP_K)
+                for key, chunks in groups.items()
+            }
+            order = sorted(article_scores, key=article_scores.get, reverse=True)
+            if lexical_order:
+                order = _fuse_rrf([order, lexical_order], config.RRF_K)
+            unique_results = self._grouped_results(groups, order, n_results)
+        self._cache_results(query, n_results, filters, mode, version, unique_results)
         return unique_results
 
+    def _article_chunks(self, article_id: str, meta: Dict, include: List[str]) -> Dict:
+        """Stored chunks of the article described by article record `meta` (unordered)."""
+        chunk_count = meta.get('chunk_count', 0)
+        chunk_ids = [make_chunk_id(article_id, i) for i in range(chunk_count)]
+        chunks = self.collection.get(ids=chunk_ids, include=include)
+        if len(chunks['ids']) < chunk_count and meta.get('link'):
+            # Records built by rebuild_article_index from legacy uuid-keyed chunks
+            chunks = self.collection.get(where={"link": meta['link']}, include=include)
+        return chunks
+
+    def get_article(self, article_id: str, include_content: bool = True) -> Optional[Dict]:
+        """
+        Direct lookup of an article by its ID (as used in callback data), without
+        any embedding pass. Returns {'content': full text, 'metadata': ...} or None.
+        """
+        stored = self.article_collection.get(ids=[article_id], include=["metadatas"])
+        if stored['ids']:
+            meta = stored['metadatas'][0]
+            if not include_content:
+                return {'content': '', 'metadata': meta}
+            chunks = self._article_chunks(article_id, meta, ["documents", "metadatas"])
+        else:
+            # No article record yet (e.g. vectors not built): look chunks up by metadata
+            chunks = self.collection.get(where={"article_id": article_id}, include=["documents", "metadatas"])
+            if not chunks['ids']:
+                return None
+            meta = chunks['metadatas'][0]
+
+        ordered = sorted(zip(chunks['metadatas'], chunks['documents']), key=lambda c: c[0].get('chunk_index', 0))
+        if ordered and 'chunker' not in ordered[0][0]:
+            # Fixed-size character slices from before token chunking: contiguous, no overlap
+            return {'content': "".join(doc for _, doc in ordered), 'metadata': meta}
+        content = join_chunks((doc, m.get('char_start'), m.get('overlap_chars')) for m, doc in ordered)
+        return {'content': content, 'metadata': meta}
+
+    # --- LLM context assembly ---
+
+    def _chunks_with_embeddings(self, res: Dict) -> List[Dict]:
+        return [
+            {'content': doc, 'metadata': meta, 'embedding': _to_list(emb)}
+            for doc, meta, emb in zip(res['documents'], res['metadatas'], res['embeddings'])
+        ]
+
+    def build_search_context(self, query: str, results: List[Dict], token_budget: int = None) -> Dict:
+        """
+        Builds summary context for `query` from the chunks of the found articles,
+        picking relevant, non-redundant chunks (MMR) up to `token_budget` tokens.
+        """
+        token_budget = token_budget or config.SUMMARY_CONTEXT_TOKENS
+        article_ids = list(dict.fromkeys(
+            r['metadata']['article_id'] for r in results if r['metadata'].get('article_id')
+        ))
+        if not article_ids:
+            # Legacy chunks without article IDs: use the matched chunks as they are
+            text = "\n\n".join(f"Статья: {r['metadata']['title']}\n{r['content']}" for r in results)
+            text = trim_to_tokens(text, token_budget)
+            return {'text': text, 'tokens': count_tokens(text), 'chunks': len(results), 'articles': len(results)}
+
+        query_embedding = self.embed_queries([query])[0]
+        where = {"article_id": {"$in": article_ids}} if len(article_ids) > 1 else {"article_id": article_ids[0]}
+        res = self.collection.query(
+            query_embeddings=[query_embedding],
+            n_results=config.CONTEXT_CANDIDATES,
+            where=where,
+            include=["documents", "metadatas", "embeddings"]
+        )
+        chunks = self._chunks_with_embeddings({k: res[k][0] for k in ("documents", "metadatas", "embeddings")})
+        return build_context(query_embedding, chunks, token_budget)
+
+    def build_article_context(self, article_id: str, token_budget: int = None) -> Optional[Dict]:
+        """
+        Builds quiz context for one article: its most representative chunks
+        (closest to the article vector, MMR-diversified) within `token_budget`.
+        """
+        token_budget = token_budget or config.QUIZ_CONTEXT_TOKENS
+        stored = self.article_collection.get(ids=[article_id], include=["metadatas", "embeddings"])
+        if not stored['ids']:
+            return None
+        meta = stored['metadatas'][0]
+        res = self._article_chunks(article_id, meta, ["documents", "metadatas", "embeddings"])
+        chunks = self._chunks_with_embeddings(res)
+        context = build_context(_to_list(stored['embeddings'][0]), chunks, token_budget)
+        context['title'] = meta.get('title', '')
+        return context
+
     def get_recommendations(self, article_title: str, n_results: int = 3) -> List[Dict]:
         """
         Finds articles similar to the given one.
         Excludes the article itself from results.
+        `article_title` may be truncated (as in callback data), so it is matched by prefix.
         """
-        # Fetch more results to allow buffering for exclusion
+        # Candidates share the stored title prefix; the full check narrows them down
+        stored = self.article_collection.get(where={"title_prefix": article_title[:TITLE_PREFIX_CHARS]},
+                                             include=["metadatas"])
+        for article_id, meta in zip(stored['ids'], stored['metadatas']):
+            if meta.get('title', '').startswith(article_title):
+                similar = self.get_similar_articles(article_id, n_results)
+                if similar is not None:
+                    return similar
+
+        # Fallback for articles without a stored vector: free-text search by title
         raw_results = self.search(article_title, n_results=n_results + 2)
         
         filtered_results = []
         for res in raw_results:
             # Simple title check to exclude self
-            if res['metadata']['title'] != article_title:
+            if not res['metadata']['title'].startswith(article_title):
                 filtered_results.append(res)
             
             if len(filtered_results) >= n_results:
@@ -147,6 +1092,7 @@ class RagEngine:
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     # Test script
     rag = RagEngine()
     
@@ -1,51 +1,84 @@
 import requests
+import aiohttp
+import asyncio
+import inspect
+import json
 import logging
-from bs4 import BeautifulSoup
-from typing import List, Dict
+import random
+from typing import List, Dict, Optional, Callable
+from urllib.parse import urlparse
 import time
 
 try:
     from config import config
+    from core.rate_limit import TokenBucket
+    from core.parsing import Parser
+    from core.metrics import metrics
 except ImportError:
     # Fallback for testing when running script directly from core/
     import sys
     import os
     sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     from config import config
+    from core.rate_limit import TokenBucket
+    from core.parsing import Parser
+    from core.metrics import metrics
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Statuses worth retrying: rate limiting and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def write_jsonl(articles: List[Dict], path: str, append: bool = True) -> int:
+    """
+    Writes fetched articles as JSON lines (the format `python -m core.kb_cli import`
+    reads). Articles without full text are skipped. Returns the number written.
+    """
+    written = 0
+    with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+        for article in articles:
+            if not article.get('full_text'):
+                continue
+            f.write(json.dumps(article, ensure_ascii=False) + "\n")
+            written += 1
+    return written
+
 class HabrScraper:
-    def __init__(self):
-        self.rss_url = config.HABR_RSS_URL
+    def __init__(self, rss_url: str = None, parser: str = None):
+        self.rss_url = rss_url or config.HABR_RSS_URL
+        # "lxml" (targeted extraction, falls back to bs4 per document) or "bs4"
+        self.parser = Parser(parser or config.SCRAPER_PARSER)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
+        # Async mode state: one keep-alive session and a rate limiter per host
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def _parse_rss(self, content: bytes) -> List[Dict]:
+        metrics.inc("scraper_bytes_total", len(content), kind="rss")
+        with metrics.timer("scraper_parse_seconds", kind="rss", parser=self.parser.name):
+            return self.parser.parse_rss(content)
+
+    def _parse_article(self, content: bytes, url: str) -> str:
+        metrics.inc("scraper_bytes_total", len(content), kind="article")
+        with metrics.timer("scraper_parse_seconds", kind="article", parser=self.parser.name):
+            text = self.parser.parse_article(content)
+        if not text:
+            logger.warning(f"Could not find content for {url}")
+        return text
 
     def fetch_rss_feed(self) -> List[Dict]:
         """Fetches the RSS feed and returns a list of articles (metadata)."""
         try:
-            response = requests.get(self.rss_url, headers=self.headers, timeout=10)
+            with metrics.timer("scraper_fetch_seconds", kind="rss"):
+                response = requests.get(self.rss_url, headers=self.headers, timeout=10)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'xml')
-            items = soup.find_all('item')
-            
-            articles = []
-            for item in items:
-                article = {
-                    'title': item.title.text if item.title else 'No Title',
-                    'link': item.link.text if item.link else '',
-                    'pub_date': item.pubDate.text if item.pubDate else '',
-                    'description': BeautifulSoup(item.description.text, 'html.parser').get_text(separator=' ', strip=True) if item.description else '',
-                    'creator': item.find('creator').text if item.find('creator') else (item.find('dc:creator').text if item.find('dc:creator') else 'Habr User')
-                }
-                articles.append(article)
-            
+
+            articles = self._parse_rss(response.content)
             logger.info(f"Fetched {len(articles)} articles from RSS.")
             return articles
-            
+
         except Exception as e:
             logger.error(f"Error fetching RSS feed: {e}")
             return []
@@ -54,43 +87,160 @@ class HabrScraper:
         """Fetches the full content of a specific article."""
         try:
             time.sleep(1) # Be polite
-            response = requests.get(url, headers=self.headers, timeout=10)
+            with metrics.timer("scraper_fetch_seconds", kind="article"):
+                response = requests.get(url, headers=self.headers, timeout=10)
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # This selector might need adjustment based on Habr's current layout
-            # Usually content is in a div with class 'article-formatted-body' or similar
-            content_div = soup.find('div', id='post-content-body')
-            
-            if not content_div:
-                # Try alternative classes if ID search fails
-                content_div = soup.find('div', class_='article-formatted-body')
-            
-            if content_div:
-                return content_div.get_text(separator=' ', strip=True)
-            else:
-                logger.warning(f"Could not find content for {url}")
-                return ""
-                
+
+            return self._parse_article(response.content, url)
+
         except Exception as e:
             logger.error(f"Error fetching article content {url}: {e}")
             return ""
 
-    def get_latest_articles(self, limit: int = 5) -> List[Dict]:
-        """Orchestrator: fetches RSS, then fetches full content for top N articles."""
+    def get_latest_articles(self, limit: int = 5, skip: Callable[[Dict], bool] = None) -> List[Dict]:
+        """
+        Orchestrator: fetches RSS, then fetches full content for top N articles.
+        Articles for which `skip(article)` is true (e.g. already ingested and unchanged)
+        are returned with RSS metadata only, without fetching their page.
+        """
         articles = self.fetch_rss_feed()
         results = []
-        
+
         for article in articles[:limit]:
+            if skip and skip(article):
+                results.append(article)
+                continue
             content = self.fetch_article_content(article['link'])
             if content:
                 article['full_text'] = content
                 results.append(article)
-        
+
         return results
 
+    # --- Async mode ---
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so it is bound to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=config.SCRAPER_CONCURRENCY)
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=config.SCRAPER_TIMEOUT),
+            )
+        return self._session
+
+    def _get_bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(config.SCRAPER_RATE_PER_HOST, config.SCRAPER_BURST)
+        return self._buckets[host]
+
+    async def _fetch_async(self, url: str, kind: str = "article") -> Optional[bytes]:
+        """GET with per-host rate limiting and exponential backoff on transient errors."""
+        with metrics.timer("scraper_fetch_seconds", kind=kind):
+            content = await self._fetch_with_retries(url)
+        metrics.inc("scraper_fetches_total", kind=kind, result="ok" if content is not None else "failed")
+        return content
+
+    async def _fetch_with_retries(self, url: str) -> Optional[bytes]:
+        session = self._get_session()
+        bucket = self._get_bucket(url)
+
+        for attempt in range(config.SCRAPER_MAX_RETRIES + 1):
+            await bucket.acquire()
+            retry_after = None
+            try:
+                async with session.get(url) as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = response.headers.get('Retry-After')
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=response.reason or ''
+                        )
+                    response.raise_for_status()
+                    return await response.read()
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRY_STATUSES:
+                    logger.error(f"Error fetching {url}: HTTP {e.status}")
+                    return None
+                error = e
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+
+            if attempt == config.SCRAPER_MAX_RETRIES:
+                logger.error(f"Giving up on {url} after {attempt + 1} attempts: {error!r}")
+                return None
+
+            delay = config.SCRAPER_BACKOFF_BASE * (2 ** attempt) + random.uniform(0, config.SCRAPER_BACKOFF_BASE)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            logger.warning(f"Retrying {url} in {delay:.2f}s ({error!r})")
+            metrics.inc("scraper_retries_total")
+            await asyncio.sleep(delay)
+
+        return None
+
+    async def fetch_rss_feed_async(self) -> List[Dict]:
+        """Async version of fetch_rss_feed."""
+        content = await self._fetch_async(self.rss_url, kind="rss")
+        if content is None:
+            return []
+        try:
+            # Parsing is CPU-bound: keep it off the bot's event loop
+            articles = await asyncio.to_thread(self._parse_rss, content)
+        except Exception as e:
+            logger.error(f"Error parsing RSS feed: {e}")
+            return []
+        logger.info(f"Fetched {len(articles)} articles from RSS.")
+        return articles
+
+    async def fetch_article_content_async(self, url: str) -> str:
+        """Async version of fetch_article_content. Politeness is handled by the host rate limiter."""
+        content = await self._fetch_async(url)
+        if content is None:
+            return ""
+        try:
+            return await asyncio.to_thread(self._parse_article, content, url)
+        except Exception as e:
+            logger.error(f"Error parsing article content {url}: {e}")
+            return ""
+
+    async def get_latest_articles_async(self, limit: int = 5, concurrency: int = None,
+                                        skip: Callable = None) -> List[Dict]:
+        """
+        Async orchestrator: fetches RSS, then fetches full content for top N articles
+        concurrently. Returns the same article dicts as get_latest_articles, in feed order.
+        """
+        articles = await self.fetch_rss_feed_async()
+        semaphore = asyncio.Semaphore(concurrency or config.SCRAPER_CONCURRENCY)
+
+        async def fill(article: Dict) -> Optional[Dict]:
+            if skip:
+                # skip may be a plain predicate or an async one (e.g. AsyncRagEngine.is_unchanged)
+                skipped = skip(article)
+                if inspect.isawaitable(skipped):
+                    skipped = await skipped
+                if skipped:
+                    return article
+            async with semaphore:
+                content = await self.fetch_article_content_async(article['link'])
+            if content:
+                article['full_text'] = content
+                return article
+            return None
+
+        filled = await asyncio.gather(*(fill(a) for a in articles[:limit]))
+        return [a for a in filled if a]
+
+    async def close(self):
+        """Closes the shared async session."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     scraper = HabrScraper()
     articles = scraper.get_latest_articles(2)
     for a in articles:
@@ -0,0 +1,31 @@
+import re
+
+import pytest
+
+from core.chunker import TokenChunker, join_chunks
+
+class WordTokenizer:
+    """Whitespace tokenizer with the parts of the HF tokenizer API the chunker uses."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        spans = [m.span() for m in re.finditer(r"\S+", text)]
+        encoded = {'input_ids': list(range(len(spans)))}
+        if return_offsets_mapping:
+            encoded['offset_mapping'] = spans
+        return encoded
+
+def stored_chunks(chunker, text):
+    """Chunks with the offsets RagEngine.add_documents stores for them."""
+    previous_end = 0
+    for start, end, _ in chunker.iter_chunk_spans(text):
+        yield text[start:end], start, max(0, previous_end - start)
+        previous_end = end
+
+@pytest.mark.parametrize("overlap", [0, 3])
+@pytest.mark.parametrize("text", [
+    "beta alpha. beta beta gamma. beta gamma. beta gamma. delta epsilon. beta gamma. zeta.",
+    " ".join(f"word{i}" for i in range(40)) + ". Short one. " * 5,
+])
+def test_join_chunks_rebuilds_text(text, overlap):
+    chunker = TokenChunker(WordTokenizer(), max_tokens=5, overlap_tokens=overlap)
+    assert join_chunks(stored_chunks(chunker, text)) == text.strip()
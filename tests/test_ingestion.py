@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("chromadb")
+
+from core.ingestion import IngestionJob
+
+def test_chat_joining_during_final_message_gets_it():
+    received = []
+
+    async def scenario():
+        job = IngestionJob("manual")
+
+        async def first(text):
+            received.append(("first", text))
+            # Another chat presses the button while the result is being sent
+            job.subscribe(late)
+
+        async def late(text):
+            received.append(("late", text))
+
+        job.subscribe(first)
+        await job.finish("done")
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert received == [("first", "done"), ("late", "done")]
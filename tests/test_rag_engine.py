@@ -0,0 +1,114 @@
+import hashlib
+import re
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+pytest.importorskip("sentence_transformers")
+
+from config import config
+from core import rag_engine
+
+DIM = 16
+
+class WordTokenizer:
+    """Whitespace tokenizer with the parts of the HF tokenizer API the chunker uses."""
+    name_or_path = "words"
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+        spans = [m.span() for m in re.finditer(r"\S+", text)]
+        encoded = {'input_ids': list(range(len(spans)))}
+        if return_offsets_mapping:
+            encoded['offset_mapping'] = spans
+        return encoded
+
+class HashBackend(rag_engine.EmbeddingBackend):
+    """Deterministic bag-of-words vectors, so tests need no model download."""
+    backend_name = "test"
+
+    def _load_model(self):
+        return None
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = [0.0] * DIM
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIM] += 1.0
+            norm = sum(v * v for v in vector) ** 0.5 or 1.0
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+    @property
+    def tokenizer(self):
+        return WordTokenizer()
+
+    @property
+    def max_seq_length(self) -> int:
+        return 64
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "CHROMA_HOST", None)
+    monkeypatch.setattr(config, "CHROMA_PATH", str(tmp_path / "chroma"))
+    monkeypatch.setattr(config, "BM25_INDEX_PATH", str(tmp_path / "bm25.json.gz"))
+    monkeypatch.setattr(config, "STORE_LOCK_PATH", str(tmp_path / "store.lock"))
+    monkeypatch.setattr(rag_engine, "create_embedding_backend", lambda *args, **kwargs: HashBackend())
+    return tmp_path
+
+def test_opens_collection_created_before_upgrade(store):
+    # Baseline created the collection with Chroma's default embedding function
+    # and uuid chunk IDs
+    client = chromadb.PersistentClient(path=config.CHROMA_PATH)
+    legacy = client.get_or_create_collection(name=rag_engine.CHUNK_COLLECTION)
+    text = "asyncio event loop and tasks in Python"
+    legacy.add(ids=["0b7c1e4e-legacy"], documents=[text], embeddings=HashBackend()([text]),
+               metadatas=[{"title": "Asyncio", "link": "https://habr.com/1", "pub_date": "", "creator": "bob"}])
+    del client
+
+    rag = rag_engine.RagEngine()
+
+    assert rag.collection.count() == 1
+    assert rag.article_collection.count() == 1
+    assert len(rag.lexical_index) == 1
+    assert rag.search_lexical("asyncio", n_results=1)[0]['metadata']['link'] == "https://habr.com/1"
+
+    # The article record was built from uuid-keyed chunks; its text is still found
+    article_id = rag_engine.make_article_id("https://habr.com/1")
+    assert rag.get_article(article_id)['content'] == text
+    assert rag.build_article_context(article_id)['text']
+
+def article(n, text):
+    return {'title': f"Article {n}", 'link': f"https://habr.com/{n}", 'full_text': text,
+            'pub_date': "", 'description': "", 'creator': "alice"}
+
+def test_neighbour_lists_drop_scores_of_updated_articles(store, monkeypatch):
+    monkeypatch.setattr(config, "ARTICLE_NEIGHBOURS_K", 2)
+    rag = rag_engine.RagEngine()
+    rag.add_documents([
+        article(1, "python asyncio event loop tasks"),
+        article(2, "python asyncio event loop coroutines"),
+        article(3, "python asyncio futures and tasks"),
+        article(4, "rust borrow checker lifetimes"),
+    ])
+    # Article 2 moves far away from the Python articles
+    rag.add_documents([article(2, "kubernetes helm charts ingress")])
+
+    stored = rag.article_collection.get(include=["embeddings", "metadatas"])
+    vectors = dict(zip(stored['ids'], stored['embeddings']))
+    for aid, meta in zip(stored['ids'], stored['metadatas']):
+        for nid, score in rag_engine._load_neighbours(meta):
+            assert score == pytest.approx(float(vectors[aid] @ vectors[nid]), abs=1e-3)
+
+def test_lexical_search_widens_past_one_long_article(store, monkeypatch):
+    monkeypatch.setattr(config, "SEARCH_FETCH_FACTOR", 1)
+    rag = rag_engine.RagEngine()
+    long_text = " ".join(f"Sentence {i} is about asyncio and asyncio again." for i in range(60))
+    rag.add_documents([
+        article(1, long_text),
+        article(2, "A short note that mentions asyncio once, among many other unrelated words here."),
+    ])
+    assert rag.collection.count() > 4
+
+    results = rag.search_lexical("asyncio", n_results=2)
+    assert [r['metadata']['link'] for r in results] == ["https://habr.com/1", "https://habr.com/2"]